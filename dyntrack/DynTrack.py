@@ -1,9 +1,16 @@
 from typing import Any, Union, Optional  # Meta
-from typing import Mapping
+from typing import Mapping, Tuple
 import pandas as pd
 import numpy as np
 
 
+def _copy_on_write():
+    # always enabled from pandas 3, where reading the option is deprecated
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True
+    return pd.options.mode.copy_on_write is True
+
+
 class DynTrack:
     """A python object containing the data used for dynamical tracks analysis.
 
@@ -18,13 +25,37 @@ class DynTrack:
     Y
         y coordinates of the grid vector field.
     u
-        x component of the vectors.
+        x component of the vectors, stacked along the first axis for multiple fields.
     v
-        y component of the vectors.
+        y component of the vectors, stacked along the first axis for multiple fields.
     ftle
         scalar FTLE values calculated from vector field.
+    ftles
+        scalar FTLE values of each integration time.
+    ftle_fwd
+        scalar FTLE values of the forward integration.
+    ftle_bwd
+        scalar FTLE values of the backward integration.
+    flow_map
+        state of the FTLE particles at the longest integration time.
+    ftle_grid
+        x and y coordinates of the FTLE seeds, when not seeded on the vector field grid.
+    ftle_t
+        scalar FTLE values starting at each time window, stacked along the first axis.
+    ftle_times
+        start time of each FTLE field of ftle_t.
     ppts
-        list of principal trees fitted for each frame of the tracking."""
+        list of principal trees fitted for each frame of the tracking.
+    field_assignment
+        vector field index and fitting error of each track.
+    vector_fields
+        X, Y, u, v, field_assignment and CG iterations of each fitted grid resolution.
+    u_t
+        x component of the vectors of each time window, stacked along the first axis.
+    v_t
+        y component of the vectors of each time window, stacked along the first axis.
+    time_windows
+        start and end time of each time window."""
 
     def __init__(
         self,
@@ -35,7 +66,19 @@ class DynTrack:
         u: Optional[Union[np.ndarray, None]] = None,
         v: Optional[Union[np.ndarray, None]] = None,
         ftle: Optional[Union[np.ndarray, None]] = None,
+        ftles: Optional[Mapping[float, np.ndarray]] = None,
+        ftle_fwd: Optional[Union[np.ndarray, None]] = None,
+        ftle_bwd: Optional[Union[np.ndarray, None]] = None,
+        flow_map: Optional[Mapping[str, Any]] = None,
+        ftle_grid: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+        ftle_t: Optional[Union[np.ndarray, None]] = None,
+        ftle_times: Optional[Union[np.ndarray, None]] = None,
         ppts: Optional[Mapping[str, Any]] = None,
+        field_assignment: Optional[Union[pd.DataFrame, None]] = None,
+        vector_fields: Optional[Mapping[int, Any]] = None,
+        u_t: Optional[Union[np.ndarray, None]] = None,
+        v_t: Optional[Union[np.ndarray, None]] = None,
+        time_windows: Optional[Union[np.ndarray, None]] = None,
     ):
         self.track_data = track_data
         self.img = img
@@ -44,19 +87,239 @@ class DynTrack:
         self.u = u
         self.v = v
         self.ftle = ftle
+        self.ftles = ftles
+        self.ftle_fwd = ftle_fwd
+        self.ftle_bwd = ftle_bwd
+        self.flow_map = flow_map
+        self.ftle_grid = ftle_grid
+        self.ftle_t = ftle_t
+        self.ftle_times = ftle_times
         self.ppts = ppts
+        self.field_assignment = field_assignment
+        self.vector_fields = vector_fields
+        self.u_t = u_t
+        self.v_t = v_t
+        self.time_windows = time_windows
+
+    @property
+    def track_data(self):
+        return self._track_data
+
+    @track_data.setter
+    def track_data(self, track_data: pd.DataFrame):
+        self._track_data = track_data
+        self._index, self._indexed = {}, {}
+        for by in ["Parent", "Time"]:
+            self.group_index(by)
+
+    def _build_index(self, by: str):
+        values = self._track_data[by].values
+        order = np.argsort(values, kind="stable")
+        order = order[~pd.isna(values[order])]
+        if len(values) < 2**31:
+            order = order.astype(np.int32)
+        keys, offsets = np.unique(values[order], return_index=True)
+        return order, keys, np.append(offsets, len(order))
+
+    def _is_indexed(self, by: str):
+        # the indexed column is kept, so that its buffer is not reused and,
+        # under copy-on-write, any later write to the column replaces it
+        if by not in self._index or by not in self._indexed:
+            return False
+        old, new = self._indexed[by].values, self._track_data[by].values
+        if isinstance(old, np.ndarray) and isinstance(new, np.ndarray):
+            return (
+                old.__array_interface__["data"][0] == new.__array_interface__["data"][0]
+                and old.shape == new.shape
+                and old.strides == new.strides
+            )
+        return old is new
+
+    def group_index(self, by: str):
+        """\
+        Sorted, offset-based index of `track_data` grouped by a column.
+
+        The index is built when `track_data` is assigned, and rebuilt when
+        the column was replaced or modified since, e.g. by an in place sort
+        or drop of `track_data`. Without pandas copy-on-write, writing values
+        in place into the column is not detected, and requires assigning
+        `track_data` again. Rows with a missing value in the column are left
+        out.
+
+        Parameters
+        ----------
+        by
+            Column to group rows by, usually "Parent" or "Time".
+
+        Returns
+        -------
+        order, keys, offsets
+            rows ``order[offsets[i]:offsets[i + 1]]`` of `track_data` are the
+            ones having the value ``keys[i]``.
+
+        """
+        if not self._is_indexed(by):
+            self._index[by] = self._build_index(by)
+            self._indexed[by] = self._track_data[by]
+        return self._index[by]
+
+    def copy(self):
+        """\
+        Return a copy sharing its data with this object.
+
+        Arrays are not duplicated but shared between both objects, and made
+        read-only, in this object as well, so that neither object can modify
+        the other one. Tools store their results in new arrays, modifying an
+        array in place requires replacing it with a copy first, e.g.
+        ``DT.img = DT.img.copy()``. DataFrames are shared through a shallow
+        copy when pandas copy-on-write is enabled, which duplicates them on
+        write, and are copied otherwise.
+
+        Returns
+        -------
+        DT : :class:`dyntrack.DynTrack`
+
+        """
+
+        deep = not _copy_on_write()
+
+        def share(value):
+            if isinstance(value, np.ndarray):
+                value.flags.writeable = False
+                return value
+            if isinstance(value, (pd.DataFrame, pd.Series)):
+                return value.copy(deep=deep)
+            if isinstance(value, dict):
+                return {k: share(v) for k, v in value.items()}
+            if isinstance(value, list):
+                return [share(v) for v in value]
+            return value
+
+        new = DynTrack.__new__(DynTrack)
+        new._track_data = self._track_data.copy(deep=deep)
+        new._index = {
+            by: tuple(share(a) for a in self.group_index(by))
+            for by in list(self._index)
+        }
+        new._indexed = {by: new._track_data[by] for by in new._index}
+        for attr, value in vars(self).items():
+            if attr not in ["_track_data", "_index", "_indexed"]:
+                setattr(new, attr, share(value))
+        return new
+
+    def save(self, path: str):
+        """\
+        Save to a directory, see :func:`dyntrack.ut.write`.
+
+        Parameters
+        ----------
+        path
+            Directory to write to, read back with :func:`dyntrack.ut.read`.
+
+        """
+        from .utils.storage import write
+
+        write(self, path)
+
+    def select_vector_field(self, gridRes: int):
+        """\
+        Set the vector field of a given resolution as the current one.
+
+        Parameters
+        ----------
+        gridRes
+            grid resolution among the ones stored in `vector_fields`.
+
+        """
+        if self.vector_fields is None or gridRes not in self.vector_fields:
+            raise ValueError(f"no vector field was fitted with gridRes={gridRes}")
+        for attr, value in self.vector_fields[gridRes].items():
+            if attr != "iterations":
+                setattr(self, attr, value)
+
+    def get_uv(self, field: int = 0):
+        """\
+        Return the components of one of the fitted vector fields.
+
+        Parameters
+        ----------
+        field
+            Index of the vector field, if several were fitted.
+
+        Returns
+        -------
+        u, v
+            x and y components of the vectors.
+
+        """
+        if self.u is None:
+            raise ValueError("no vector field was fitted, run tl.vector_field first")
+        if self.u.ndim == 2:
+            if field != 0:
+                raise ValueError(f"a single vector field was fitted, not field={field}")
+            return self.u, self.v
+        return self.u[field], self.v[field]
+
+    def velocity_at(self, points: np.ndarray, field: int = 0):
+        """\
+        Interpolate the vector field at arbitrary points.
+
+        The interpolator is built once per vector field and reused by the
+        following calls, both components being evaluated together.
+
+        Parameters
+        ----------
+        points
+            (n, 2) array of x and y coordinates, or a single (x, y) point.
+        field
+            Index of the vector field to use, if several were fitted.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            (n, 2) array of the u and v components at each point.
+
+        """
+        key = (self.X, self.Y, self.u, self.v, field)
+        cached = getattr(self, "_interpolator", None)
+        if cached is None or any(a is not b for a, b in zip(cached[0], key)):
+            from .utils.interpolate import VelocityInterpolator
+
+            u, v = self.get_uv(field)
+            self._interpolator = key, VelocityInterpolator(self.X, self.Y, u, v)
+        return self._interpolator[1](points)
 
     def __repr__(self):
         dp = self.track_data.shape[0]
-        tr = len(self.track_data.Parent.unique())
+        tr = len(self.group_index("Parent")[1])
 
         descr = f"DynTrack object with the following data:"
         descr += f"\n    track_data ({tr} tracks, {dp} datapoints)"
-        for attr in ["img", "X", "Y", "u", "v", "ftle", "ppts"]:
+        for attr in [
+            "img",
+            "X",
+            "Y",
+            "u",
+            "v",
+            "u_t",
+            "v_t",
+            "ftle",
+            "ftles",
+            "ftle_fwd",
+            "ftle_bwd",
+            "ftle_t",
+            "ppts",
+            "field_assignment",
+            "vector_fields",
+        ]:
             dt = getattr(self, attr)
-            if (dt is not None) & (attr != "ppts"):
+            if (dt is not None) & (attr not in ["ftles", "ppts", "vector_fields"]):
                 descr += f"\n    {attr} {dt.shape}"
             if (dt is not None) & (attr == "ppts"):
                 descr += f"\n    {attr} ({len(dt)} ppt)"
+            if (dt is not None) & (attr == "ftles"):
+                descr += f"\n    {attr} ({', '.join(map(str, dt))} integration time)"
+            if (dt is not None) & (attr == "vector_fields"):
+                descr += f"\n    {attr} ({', '.join(map(str, dt))} gridRes)"
 
         return descr
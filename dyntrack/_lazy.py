@@ -0,0 +1,45 @@
+"""Lazy loading of the functions of a module."""
+
+import importlib
+import importlib.util
+import sys
+import types
+
+
+def attach(module_name: str, attributes: dict):
+    """Returns ``__getattr__``, ``__dir__`` and ``__all__`` for a module.
+
+    Each attribute is imported from its module, given relative to the package
+    of `module_name`, the first time it is accessed. The module can also be a
+    package whose attributes are themselves attached lazily. Heavy
+    dependencies of the tools and plots are thus only imported when used.
+    """
+    module = sys.modules[module_name]
+    sources = {
+        name: importlib.util.resolve_name(path, module.__package__)
+        for name, path in attributes.items()
+    }
+
+    class LazyModule(types.ModuleType):
+        def __setattr__(self, name, value):
+            # importing a submodule binds it on its package, possibly under
+            # the name of one of its functions, which is kept instead
+            submodule = isinstance(value, types.ModuleType)
+            if submodule and value.__name__ == sources.get(name):
+                value = getattr(value, name)
+            super().__setattr__(name, value)
+
+    module.__class__ = LazyModule
+
+    def __getattr__(name):
+        if name not in attributes:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        # for a lazy package, this binds the attribute there as well
+        value = getattr(importlib.import_module(sources[name]), name)
+        setattr(module, name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(module)) | set(attributes))
+
+    return __getattr__, __dir__, list(attributes)
@@ -1 +1,6 @@
-from .plot import *
+from ._lazy import attach
+from . import plot
+
+__getattr__, __dir__, __all__ = attach(__name__, dict.fromkeys(plot.__all__, ".plot"))
+
+del attach, plot
@@ -1,4 +1,14 @@
-from .tracks import tracks
-from .vector_field import vector_field
-from .ftle import FTLE
-from .fit_ppt import fit_ppt
+from .._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    {
+        "tracks": ".tracks",
+        "track_density": ".track_density",
+        "vector_field": ".vector_field",
+        "FTLE": ".ftle",
+        "fit_ppt": ".fit_ppt",
+    },
+)
+
+del attach
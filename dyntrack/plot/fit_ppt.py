@@ -42,10 +42,14 @@ def fit_ppt(
     tdata = DT.track_data
 
     times = tdata.Time.unique() if times is None else times
+    order, frames, offsets = DT.group_index("Time")
+    xy = tdata[["Position X", "Position Y"]].values[order]
+    start = offsets[np.searchsorted(frames, times, side="left")]
+    stop = offsets[np.searchsorted(frames, times, side="right")]
+
     ax.set_aspect("equal")
-    i = 0
-    for t in times:
-        toproject = tdata.loc[tdata.Time == t, ["Position X", "Position Y"]]
+    for i in range(len(times)):
+        toproject = xy[start[i] : stop[i]]
         simpleppt.project_ppt(
             DT.ppts[i],
             toproject,
@@ -55,7 +59,6 @@ def fit_ppt(
             alpha_seg=0.05,
             show=False,
         )
-        i = i + 1
 
     if DT.img is not None:
         ax.imshow(DT.img, origin="lower")
@@ -1,4 +1,4 @@
-from typing import Union
+from typing import Union, Optional
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import numpy as np
@@ -18,6 +18,8 @@ def FTLE(
     show: bool = True,
     kwargs_for_countourf={},
     kwargs_for_streamplot={},
+    field: int = 0,
+    integration_time: Optional[float] = None,
 ):
     """\
     Plotting counterpart of `tl.FTLE`.
@@ -46,6 +48,11 @@ def FTLE(
         Arguments passed to :func:`matplotlib.pyplot.contourf`.
     **kwargs_for_streamplot
         Arguments passed to :func:`matplotlib.pyplot.streamplot`.
+    field
+        Index of the vector field to draw streamlines from, if several were fitted.
+    integration_time
+        Integration time of the FTLE to draw among the ones of `.ftles`, by
+        default the last one computed.
 
     Returns
     -------
@@ -58,14 +65,15 @@ def FTLE(
     )
     ax.set_aspect("equal")
 
-    contf = ax.contourf(
-        DT.X, DT.Y, DT.ftle, extend="both", cmap=cmap, **kwargs_for_countourf
-    )
+    ftle = DT.ftle if integration_time is None else DT.ftles[integration_time]
+    X, Y = (DT.X, DT.Y) if DT.ftle_grid is None else DT.ftle_grid
+    contf = ax.contourf(X, Y, ftle, extend="both", cmap=cmap, **kwargs_for_countourf)
+    u, v = DT.get_uv(field)
     ax.streamplot(
         DT.X,
         DT.Y,
-        DT.u,
-        DT.v,
+        u,
+        v,
         density=2,
         linewidth=0.75,
         arrowsize=0.75,
@@ -0,0 +1,138 @@
+from typing import Literal, Optional, Tuple, Union
+import matplotlib.pyplot as plt
+import numpy as np
+from ..DynTrack import DynTrack
+from ..utils.density import rasterize
+from ..utils.segments import track_segments
+from matplotlib.axes import Axes
+
+
+def track_density(
+    DT: DynTrack,
+    statistic: Literal["count", "speed", "direction"] = "count",
+    bins: Optional[Union[int, Tuple[int, int]]] = None,
+    cmap: Optional[str] = None,
+    figsize: tuple = (7, 4),
+    ax: Union[Axes, None] = None,
+    show: bool = True,
+    **kwargs
+):
+    """\
+    Plotting the tracks aggregated on a grid of pixels.
+
+    Track segments are rasterized on the pixels they go through and drawn as a
+    single image, so that the drawing time depends on the number of pixels
+    rather than on the number of tracks. The aggregated values are those of
+    the drawn image, ``ax.images[-1].get_array()``.
+
+    Parameters
+    ----------
+    DT
+        A :class:`dyntrack.DynTrack` object.
+    statistic
+        Value of each pixel, the number of segments going through it
+        ("count"), their mean "speed" or their mean "direction" in radians.
+    bins
+        Number of pixels along y and x, or along x with square pixels. By
+        default the pixels of `DT.img`, or 512 along x without image.
+    cmap
+        Colormap, by default depends on the statistic.
+    figsize
+        Figure size.
+    ax
+        A matplotlib axes object.
+    show
+        Show the plot, do not return axis.
+    **kwargs
+        Arguments passed to :func:`matplotlib.pyplot.imshow`.
+
+    Returns
+    -------
+    :class:`matplotlib.axes.Axes` if `show=True`
+
+    """
+
+    if statistic not in ["count", "speed", "direction"]:
+        raise ValueError(
+            f"statistic must be 'count', 'speed' or 'direction', not {statistic!r}"
+        )
+
+    segments, _, duration = track_segments(DT)
+    delta = segments[:, 1] - segments[:, 0]
+    if statistic == "speed":
+        with np.errstate(divide="ignore", invalid="ignore"):
+            values = (np.hypot(delta[:, 0], delta[:, 1]) / duration)[:, None]
+    elif statistic == "direction":
+        angle = np.arctan2(delta[:, 1], delta[:, 0])
+        values = np.column_stack([np.cos(angle), np.sin(angle)])
+    else:
+        values = np.empty((len(segments), 0))
+    keep = np.isfinite(values).all(axis=1)
+    segments, values = segments[keep], values[keep]
+
+    if DT.img is not None:
+        height, width = DT.img.shape[:2]
+        extent = (-0.5, width - 0.5, -0.5, height - 0.5)
+    else:
+        xy = segments.reshape(-1, 2)
+        extent = (xy[:, 0].min(), xy[:, 0].max(), xy[:, 1].min(), xy[:, 1].max())
+        width, height = extent[1] - extent[0], extent[3] - extent[2]
+    if bins is None and DT.img is not None:
+        shape = DT.img.shape[:2]
+    elif bins is None or np.isscalar(bins):
+        nx = 512 if bins is None else int(bins)
+        shape = (max(int(round(nx * height / width)), 1), nx)
+    else:
+        shape = tuple(bins)
+
+    grid = np.zeros(shape + (values.shape[1] + 1,))
+    rasterize(
+        segments,
+        values,
+        extent[0],
+        extent[2],
+        (extent[1] - extent[0]) / shape[1],
+        (extent[3] - extent[2]) / shape[0],
+        grid,
+    )
+
+    count = grid[..., 0]
+    empty = count == 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if statistic == "count":
+            image = count
+        elif statistic == "speed":
+            image = grid[..., 1] / count
+        else:
+            image = np.arctan2(grid[..., 2], grid[..., 1])
+    image = np.ma.masked_array(image, empty)
+
+    if ax is None:
+        fig = plt.figure(figsize=figsize)
+        ax = fig.add_subplot(111)
+        fig.set_tight_layout(True)
+
+    ax.set_aspect("equal")
+    if DT.img is not None:
+        ax.imshow(DT.img, origin="lower")
+
+    if cmap is None:
+        cmap = {"count": "magma", "speed": "viridis", "direction": "hsv"}[statistic]
+    if statistic == "direction":
+        kwargs = {"vmin": -np.pi, "vmax": np.pi, **kwargs}
+    im = ax.imshow(
+        image,
+        origin="lower",
+        extent=extent,
+        cmap=cmap,
+        interpolation="nearest",
+        **kwargs
+    )
+    plt.colorbar(im, ax=ax, label=statistic)
+
+    ax.axis("off")
+
+    if show == False:
+        return ax
+    else:
+        plt.show()
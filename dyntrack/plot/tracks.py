@@ -1,7 +1,9 @@
-from typing import Union
+from typing import Literal, Optional, Union
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import numpy as np
 from ..DynTrack import DynTrack
+from ..utils.segments import track_segments
 from matplotlib.axes import Axes
 
 
@@ -10,11 +12,16 @@ def tracks(
     figsize: tuple = (7, 4),
     ax: Union[Axes, None] = None,
     show: bool = True,
-    **kwargs
+    color_by: Optional[Literal["speed", "time"]] = None,
+    cmap: str = "viridis",
+    rasterized: bool = False,
+    **kwargs,
 ):
     """\
     Plotting all single tracks.
 
+    All tracks are drawn as a single :class:`matplotlib.collections.LineCollection`.
+
     Parameters
     ----------
     DT
@@ -25,8 +32,16 @@ def tracks(
         A matplotlib axes object.
     show
         Show the plot, do not return axis.
+    color_by
+        Color each segment of the tracks by its "speed" or its "time", by
+        default each track gets its own color.
+    cmap
+        Colormap used with `color_by`.
+    rasterized
+        Rasterize the tracks when saving to a vector format, keeping the size
+        of figures with many tracks small.
     **kwargs
-        Arguments passed to :func:`matplotlib.pyplot.plot`.
+        Arguments passed to :class:`matplotlib.collections.LineCollection`.
 
     Returns
     -------
@@ -43,12 +58,31 @@ def tracks(
     if DT.img is not None:
         ax.imshow(DT.img, origin="lower")
 
-    for t in DT.track_data.Parent.unique():
-        ax.plot(
-            DT.track_data.loc[DT.track_data.Parent == t, "Position X"],
-            DT.track_data.loc[DT.track_data.Parent == t, "Position Y"],
-            **kwargs
-        )
+    if color_by is None:
+        # one polyline per track, cycling through the default colors
+        order, _, offsets = DT.group_index("Parent")
+        xy = DT.track_data[["Position X", "Position Y"]].values[order].astype(float)
+        lines = np.split(xy, offsets[1:-1])
+        if "color" not in kwargs and "colors" not in kwargs:
+            cycle = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+            kwargs["colors"] = [cycle[i % len(cycle)] for i in range(len(lines))]
+        lc = LineCollection(lines, **kwargs)
+    else:
+        # one segment per pair of consecutive points of a track
+        segments, time, duration = track_segments(DT)
+        if color_by == "speed":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                values = np.hypot(*(segments[:, 1] - segments[:, 0]).T) / duration
+        elif color_by == "time":
+            values = time
+        else:
+            raise ValueError(f"color_by must be 'speed' or 'time', not {color_by!r}")
+        lc = LineCollection(segments, array=values, cmap=cmap, **kwargs)
+        plt.colorbar(lc, ax=ax, label=color_by)
+
+    lc.set_rasterized(rasterized)
+    ax.add_collection(lc)
+    ax.autoscale_view()
 
     ax.axis("off")
 
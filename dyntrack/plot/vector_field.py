@@ -16,6 +16,7 @@ def vector_field(
     cmap="gnuplot",
     figsize: tuple = (7, 4),
     show: bool = True,
+    field: int = 0,
     **kwargs
 ):
     """\
@@ -43,6 +44,8 @@ def vector_field(
         Show the plot, do not return axis.
     save
         Save plot to file
+    field
+        Index of the vector field to plot, if several were fitted.
     **kwargs
         Arguments passed to :func:`matplotlib.pyplot.streamplot`.
 
@@ -59,12 +62,13 @@ def vector_field(
 
     if DT.img is not None:
         ax.imshow(DT.img, origin="lower")
-    speed = np.sqrt(DT.u ** 2 + DT.v ** 2)
+    u, v = DT.get_uv(field)
+    speed = np.sqrt(u ** 2 + v ** 2)
     h = ax.streamplot(
         DT.X,
         DT.Y,
-        DT.u,
-        DT.v,
+        u,
+        v,
         color=speed,
         density=density,
         linewidth=linewidth,
@@ -1,9 +1,3 @@
-from . import __path__
-import os
-from glob import glob
-
-vfkm = os.path.join(__path__[0], "vfkm")
-
 """Settings
 """
 
@@ -22,6 +16,14 @@ plot_suffix = ""
 """Global suffix that is appended to figure filenames.
 """
 
+cachedir = None
+"""Directory where the results of the tools are cached. By default is set to None
+and caching is disabled."""
+
+cachesize = 2**30
+"""Maximum size of the cache directory in bytes, the least recently used results
+are evicted beyond it."""
+
 
 def _set_start_time():
     from time import time
@@ -1,5 +1,8 @@
 import dyntrack as dt
 import numpy as np
+import os
+import sys
+import pytest
 
 
 def test_all():
@@ -8,6 +11,8 @@ def test_all():
     repr(DT)
 
     dt.pl.tracks(DT)
+    dt.pl.tracks(DT, color_by="speed", rasterized=True)
+    dt.pl.track_density(DT, "direction")
 
     dt.tl.vector_field(DT)
     dt.pl.vector_field(DT)
@@ -51,3 +56,469 @@ def test_all():
         [484.61573908, 231.13676703, 423.2637024, 597.67431024, 453.89848974],
         rtol=1e-2,
     )
+
+
+def test_vector_field_reference():
+    # output of the vfkm binary on the example tracks
+    ref = np.load(os.path.join(os.path.dirname(__file__), "vfkm_60.npz"))
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=60, smooth=0.2)
+
+    for f, f_ref in [(DT.u, ref["u"]), (DT.v, ref["v"])]:
+        scale = np.abs(f_ref).max()
+        assert np.median(np.abs(f - f_ref)) < 1e-3 * scale
+        assert np.percentile(np.abs(f - f_ref), 99) < 0.02 * scale
+        assert np.abs(f - f_ref).max() < 0.06 * scale
+
+
+def test_group_index():
+    DT = dt.ut.load_example()
+
+    order, keys, offsets = DT.group_index("Parent")
+    rows = DT.track_data.iloc[order[offsets[3] : offsets[4]]]
+    assert (rows.Parent == keys[3]).all()
+    assert len(rows) == (DT.track_data.Parent == keys[3]).sum()
+
+    DT.track_data = DT.track_data.loc[DT.track_data.Time < 100]
+    order, keys, offsets = DT.group_index("Time")
+    assert keys.max() < 100
+    assert offsets[-1] == DT.track_data.shape[0]
+
+
+def test_group_index_in_place():
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=20)
+    u = DT.u
+
+    DT.track_data.sort_values("Time", inplace=True)
+    dt.tl.vector_field(DT, gridRes=20)
+    assert np.allclose(DT.u, u, atol=1e-5)
+
+    DT.track_data.drop(DT.track_data.index[:100], inplace=True)
+    order, keys, offsets = DT.group_index("Parent")
+    assert order.dtype == np.int32
+    assert offsets[-1] == len(DT.track_data)
+    assert (DT.track_data.Parent.values[order][offsets[:-1]] == keys).all()
+
+
+def test_vector_field_clusters():
+    DT = dt.ut.load_example()
+
+    dt.tl.vector_field(DT, gridRes=20, n_fields=2, n_jobs=2)
+    dt.pl.vector_field(DT, field=1, show=False)
+
+    assert DT.u.shape == (2, 20, 20)
+    assert DT.v.shape == (2, 20, 20)
+    assert set(DT.field_assignment.field) == {0, 1}
+    assert (DT.field_assignment.error >= 0).all()
+
+
+def test_vector_field_preconditioners():
+    DT = dt.ut.load_example()
+
+    fields = []
+    for p in ["none", "jacobi", "multigrid"]:
+        dt.tl.vector_field(DT, gridRes=40, preconditioner=p)
+        fields.append((DT.u, DT.v))
+
+    for u, v in fields[1:]:
+        assert np.allclose(u, fields[0][0], atol=1e-5)
+        assert np.allclose(v, fields[0][1], atol=1e-5)
+
+    dt.tl.vector_field(DT, gridRes=20, max_iter=0)
+    assert DT.vector_fields[20]["iterations"] == 0
+
+
+def test_vector_field_schedule():
+    DT = dt.ut.load_example()
+
+    dt.tl.vector_field(DT, gridRes=[15, 30])
+    assert list(DT.vector_fields) == [15, 30]
+    assert DT.u.shape == (30, 30)
+
+    DT.select_vector_field(15)
+    assert DT.u.shape == (15, 15)
+    assert DT.X.shape == (15, 15)
+
+
+def test_vector_field_session():
+    DT = dt.ut.load_example()
+    session = dt.tl.VectorFieldSession(DT, gridRes=20)
+
+    for smooth in [0.2, 0.5]:
+        u, v, field_assignment, iterations = session.solve(smooth)
+    dt.tl.vector_field(DT, gridRes=20, smooth=0.5)
+    assert 0 < iterations <= DT.vector_fields[20]["iterations"]
+
+    assert np.allclose(u, DT.u, atol=1e-5)
+    assert np.allclose(v, DT.v, atol=1e-5)
+    assert np.allclose(session.X, DT.X)
+
+
+def test_cache(tmp_path):
+    DT = dt.ut.load_example()
+    dt.settings.cachedir = str(tmp_path)
+    try:
+        dt.tl.vector_field(DT, gridRes=20)
+        u = DT.u.copy()
+        DT.u = None
+        dt.tl.vector_field(DT, gridRes=20)
+        assert np.array_equal(DT.u, u)
+        assert len(list(tmp_path.glob("*.pkl"))) == 1
+
+        dt.settings.cachesize = 0
+        dt.tl.vector_field(DT, gridRes=21)
+        assert len(list(tmp_path.glob("*.pkl"))) == 0
+    finally:
+        dt.settings.cachedir = None
+        dt.settings.cachesize = 2**30
+
+
+def test_copy():
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=20)
+
+    DT2 = dt.tl.vector_field(DT, gridRes=25, copy=True)
+
+    assert DT.u.shape == (20, 20)
+    assert DT2.u.shape == (25, 25)
+    assert DT2.img is DT.img
+    assert not DT.img.flags.writeable
+    assert list(DT.vector_fields) == [20]
+
+
+def test_copy_without_copy_on_write(monkeypatch):
+    module = sys.modules[dt.DynTrack.__module__]
+    monkeypatch.setattr(module, "_copy_on_write", lambda: False)
+    DT = dt.ut.load_example()
+    DT2 = DT.copy()
+    DT2.track_data.loc[0, "Time"] = -1
+    assert DT.track_data.loc[0, "Time"] != -1
+
+
+def test_save_read(tmp_path):
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=20)
+    dt.tl.fit_ppt(DT, times=range(200, 202), seed=1)
+
+    DT.save(str(tmp_path / "exp"))
+    DT2 = dt.ut.read(str(tmp_path / "exp"))
+
+    assert isinstance(DT2.img, np.memmap)
+    assert DT2.track_data.equals(DT.track_data)
+    assert np.array_equal(DT2.u, DT.u)
+    assert DT2.field_assignment.equals(DT.field_assignment)
+    assert np.array_equal(DT2.ppts[1].F, DT.ppts[1].F)
+    assert repr(DT2) == repr(DT)
+
+
+def test_save_read_numpy_keys(tmp_path):
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=np.arange(10, 21, 10))
+    dt.tl.FTLE(DT, np.arange(50, 101, 50), 5)
+
+    DT.save(str(tmp_path / "exp"))
+    DT2 = dt.ut.read(str(tmp_path / "exp"))
+
+    assert list(DT2.ftles) == [50, 100]
+    assert list(DT2.vector_fields) == [10, 20]
+    assert np.array_equal(DT2.ftles[50], DT.ftles[50], equal_nan=True)
+
+
+def test_save_read_string_parent(tmp_path):
+    DT = dt.ut.load_example()
+    track_data = DT.track_data.copy()
+    track_data["Parent"] = ("cell" + track_data["Parent"].astype(str)).astype("string")
+    DT.track_data = track_data
+
+    DT.save(str(tmp_path / "exp"))
+    DT2 = dt.ut.read(str(tmp_path / "exp"))
+
+    assert DT2.track_data["Parent"].dtype == "string"
+    assert DT2.track_data.equals(DT.track_data)
+    assert np.array_equal(DT2.group_index("Parent")[0], DT.group_index("Parent")[0])
+
+
+def test_load_data_chunks():
+    DT = dt.ut.load_example()
+    csv = dt.__path__[0] + "/data/tracks.csv"
+
+    DT2 = dt.ut.load_data(
+        csv, "Position X", "Position Y", "Parent", "Time", chunksize=7000
+    )
+
+    assert DT2.track_data.equals(DT.track_data)
+    assert DT2.track_data["Position X"].dtype == np.float32
+    assert DT2.track_data["Parent"].dtype == np.int32
+
+
+def test_velocity_at():
+    from dyntrack.utils.FTLE import bilinear_interpolation
+
+    DT = dt.ut.load_example()
+    DT.X, DT.Y = np.meshgrid(np.linspace(0, 9, 10), np.linspace(-2, 7, 10))
+    DT.u, DT.v = 0.5 * DT.X - 2 * DT.Y + 1, DT.X * DT.Y
+
+    # bilinear interpolation reproduces bilinear fields away from the edge cells
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform([1, -1], [8, 6], (50, 2)).T
+    expected = np.column_stack([0.5 * x - 2 * y + 1, x * y])
+    assert np.allclose(DT.velocity_at(np.column_stack([x, y])), expected)
+    assert np.allclose(DT.velocity_at([x[0], y[0]]), expected[0])
+
+    # values of the original implementation on and outside the edges
+    points = [(-1.0, 2.0), (10.5, 3.3), (4.2, -3.0), (9.0, 7.0), (3.3, 6.7), (0.5, 2.5)]
+    expected = [[-3, 0], [-0.5, 27], [7, -8], [-8.5, 63], [-10.75, 22.11], [-3, 0]]
+    assert np.allclose(DT.velocity_at(points), expected)
+    assert np.allclose(
+        [
+            [bilinear_interpolation(DT.X, DT.Y, f, *p) for f in [DT.u, DT.v]]
+            for p in points
+        ],
+        expected,
+    )
+
+
+def test_ftle_horizons():
+    from dyntrack.tools.ftle import get_traj, get_ftle
+
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=20)
+    DT_once = dt.tl.FTLE(DT, 1000, 5, copy=True)
+    dt.tl.FTLE(DT, [200, 1000], 5)
+    assert list(DT.ftles) == [200, 1000]
+    traj_x, traj_y = get_traj(DT.X, DT.Y, DT.u, DT.v, 200, 5)
+    ftle = get_ftle(traj_x, traj_y, DT.X, DT.Y, 200)
+    assert np.array_equal(DT.ftles[200], ftle, equal_nan=True)
+    assert np.array_equal(DT.ftle, DT_once.ftle, equal_nan=True)
+
+    # continues from the stored flow map
+    dt.tl.FTLE(DT, 1500, 5)
+    assert DT.flow_map["time"] == 1500
+    DT_once.flow_map = None
+    dt.tl.FTLE(DT_once, 1500, 5)
+    assert np.array_equal(DT.ftle, DT_once.ftle, equal_nan=True)
+
+
+def test_ftle_dopri5():
+    from dyntrack.utils.FTLE import advance_dopri
+
+    # solid rotation, which bilinear interpolation represents exactly
+    g = np.linspace(-10, 10, 41)
+    X, Y = np.meshgrid(g, g)
+    pos = np.array([[1.0, 0.0], [0.0, -2.0]])
+    steps = np.zeros(2, dtype=np.int64)
+    signs = np.ones(2)
+    advance_dopri(pos, np.pi / 2, 0.01, 1e-8, 1e-10, X[0], Y[:, 0], -Y, X, steps, signs)
+    assert np.allclose(pos, [[0, 1], [2, 0]], atol=1e-6)
+    assert (steps > 0).all()
+
+    # seeds reaching undefined velocities stop there
+    u, v = -Y, X.copy()
+    u[20, 22] = np.nan
+    pos = np.array([[1.0, 0.0], [5.0, 5.0]])
+    advance_dopri(pos, np.pi / 2, 0.01, 1e-8, 1e-10, X[0], Y[:, 0], u, v, steps, signs)
+    assert np.isnan(pos[0]).all()
+    assert np.allclose(pos[1], [-5, 5], atol=1e-6)
+
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=20)
+    dt.tl.FTLE(DT, 1000, 5, method="dopri5")
+    assert DT.ftle.shape == (20, 20)
+    assert 0 < DT.flow_map["n_steps"] < 20 * 20 * 1000 / 5
+
+    # rk4 from end positions estimates the same quantity as dopri5
+    rk4 = dt.tl.FTLE(DT, 1000, 5, positions="end", copy=True)
+    assert np.nanmedian(np.abs(rk4.ftle - DT.ftle)) < 0.1 * np.nanmedian(
+        np.abs(DT.ftle)
+    )
+    with pytest.raises(ValueError):
+        dt.tl.FTLE(DT, 1000, 5, method="dopri5", positions="sum")
+
+
+def test_ftle_tiles(tmp_path):
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=20)
+    whole = dt.tl.FTLE(DT, 500, 5, resolution=(30, 40), tile_size=30, copy=True)
+    tiled = dt.tl.FTLE(
+        DT, 500, 5, resolution=(30, 40), tile_size=4, n_jobs=2, out=tmp_path, copy=True
+    )
+    assert whole.ftle.shape == (30, 40)
+    assert [len(a) for a in whole.ftle_grid] == [40, 30]
+    assert isinstance(tiled.ftle, np.memmap)
+    assert np.array_equal(whole.ftle, tiled.ftle, equal_nan=True)
+
+
+def test_rasterize():
+    from dyntrack.utils.density import rasterize
+
+    segments = np.array([[[0.5, 0.5], [3.5, 0.5]], [[0.5, 0.5], [0.5, 2.5]]])
+    grid = np.zeros((4, 4, 2))
+    rasterize(segments, np.array([[1.0], [2.0]]), 0, 0, 1, 1, grid)
+    assert grid[..., 0].sum() == 7 and grid[0, 0, 0] == 2
+    assert grid[0, 0, 1] == 3 and grid[0, 3, 1] == 1 and grid[2, 0, 1] == 2
+
+
+def test_vector_field_windows():
+    from dyntrack.utils import vfkm
+
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=20, window=100, step=50, n_jobs=2)
+    assert DT.u_t.shape == DT.v_t.shape == (len(DT.time_windows), 20, 20)
+
+    # same field as clipping the tracks of the window only
+    order = DT.group_index("Parent")[0]
+    x, y, t, parent = [
+        DT.track_data[c].values[order].astype(float)
+        for c in ["Position X", "Position Y", "Time", "Parent"]
+    ]
+    grid = vfkm.Grid(x.min(), y.min(), x.max() - x.min(), y.max() - y.min(), 20)
+    tmin, tmax = DT.time_windows[2]
+    cd = vfkm.curve_description(grid, x, y, t, parent, tmin, tmax)
+    us, vs, _, _, _ = vfkm.optimize(grid, cd, 1, 0.5)
+    assert np.allclose(us[0].reshape(20, 20), DT.u_t[2], atol=1e-5)
+    assert np.allclose(vs[0].reshape(20, 20), DT.v_t[2], atol=1e-5)
+
+
+def test_ftle_time_resolved():
+    from dyntrack.tools.ftle import seeds, flow_map, get_ftle
+    from dyntrack.utils.FTLE import advance
+
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=20, window=40, step=10)
+    dt.tl.FTLE(DT, 60, 1, time_resolved=True)
+    assert DT.ftle_t.shape == (len(DT.time_windows) - 5, 20, 20)
+    with pytest.raises(ValueError):
+        dt.tl.FTLE(DT, 60, 1, time_resolved=True, positions="sum")
+
+    # composed flow maps are close to integrating through the windows
+    xy = seeds(DT.X, DT.Y)
+    state = np.hstack([xy, xy])
+    signs = np.ones(len(state))
+    for k in range(6):
+        advance(state, 10, 1.0, DT.X[0], DT.Y[:, 0], DT.u_t[k], DT.v_t[k], signs)
+    direct = get_ftle(*flow_map(state[:, :2], DT.X), DT.X, DT.Y, 60)
+    assert np.corrcoef(direct.ravel(), DT.ftle_t[0].ravel())[0, 1] > 0.95
+
+
+def test_ftle_both_directions():
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=20)
+    dt.tl.FTLE(DT, 500, 5, direction="both")
+    forward = dt.tl.FTLE(DT, 500, 5, copy=True)
+    assert np.array_equal(DT.ftle_fwd, forward.ftle, equal_nan=True)
+    assert np.array_equal(DT.ftle, forward.ftle, equal_nan=True)
+
+    # backward integration is forward integration of the reversed field
+    DT.u, DT.v = -DT.u, -DT.v
+    backward = dt.tl.FTLE(DT, 500, 5, copy=True)
+    assert np.array_equal(DT.ftle_bwd, backward.ftle, equal_nan=True)
+    assert forward.ftle_bwd is None
+
+
+def test_positional_copy():
+    DT = dt.ut.load_example()
+
+    DT2 = dt.tl.fit_ppt(DT, [200], 10, 10, True, seed=1)
+    assert DT.ppts is None and len(DT2.ppts) == 1
+
+    DT2 = dt.tl.vector_field(DT, 20, 0.5, True)
+    assert DT.u is None and DT2.u.shape == (20, 20)
+    DT3 = dt.tl.FTLE(DT2, 100, 5, True)
+    assert DT2.ftle is None and DT3.ftle.shape == (20, 20)
+    with pytest.raises(ValueError):
+        dt.tl.FTLE(DT2, 100, 5, field=1)
+    ax, cax = dt.pl.FTLE(DT3, "viridis", 1, show=False)
+    assert ax.collections[0].get_cmap().name == "viridis"
+
+
+def test_cache_concurrent_eviction(tmp_path, monkeypatch):
+    from dyntrack.utils import cache
+
+    dt.settings.cachedir = str(tmp_path)
+    try:
+        (tmp_path / "a.pkl").write_bytes(b"0" * 10)
+        (tmp_path / "b.pkl").write_bytes(b"0" * 10)
+        # another process removes the entries between listing and removal
+        remove = os.remove
+        monkeypatch.setattr(cache.os, "remove", lambda p: (remove(p), remove(p)))
+        cache.evict(0)
+        assert not list(tmp_path.glob("*.pkl"))
+    finally:
+        dt.settings.cachedir = None
+
+
+def test_lazy_attributes():
+    DT = dt.ut.load_example()
+    dt.pl.track_density(DT, show=False)
+    from dyntrack.plot import tracks, track_density
+
+    assert callable(tracks) and callable(track_density)
+    for module in [dt.pl, dt.tl, dt.ut, dt.plot, dt.tools]:
+        assert not {"attach", "_attributes"} & set(dir(module))
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "from dyntrack.tools.vector_field import VectorFieldSession",
+        "import dyntrack.utils.load_data",
+        "import dyntrack.utils.warmup",
+        "import dyntrack.tools.fit_ppt",
+        "import dyntrack.plot.vector_field",
+        "import dyntrack.plot.fit_ppt",
+    ],
+)
+def test_lazy_attributes_submodule_first(statement):
+    import subprocess
+
+    # functions sharing the name of their module stay bound after the
+    # submodule is imported first, in a fresh interpreter
+    code = f"""{statement}
+import dyntrack as dt
+from dyntrack.tools import vector_field, fit_ppt
+from dyntrack.utils import load_data, warmup
+from dyntrack.plot import vector_field as pl_vector_field, fit_ppt as pl_fit_ppt
+functions = [vector_field, fit_ppt, load_data, warmup, pl_vector_field, pl_fit_ppt]
+functions += [dt.tl.vector_field, dt.tl.fit_ppt, dt.ut.load_data, dt.ut.warmup]
+functions += [dt.pl.vector_field, dt.pl.fit_ppt, dt.tools.vector_field]
+assert all(callable(f) for f in functions), functions
+"""
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_ftle_dtypes():
+    from dyntrack.utils.FTLE import bilinear_interpolation
+
+    DT = dt.ut.load_example()
+    dt.tl.vector_field(DT, gridRes=20)
+    ftle = dt.tl.FTLE(DT, 200, 5, copy=True).ftle
+    DT.X, DT.Y, DT.u, DT.v = [a.astype(np.float32) for a in [DT.X, DT.Y, DT.u, DT.v]]
+    dt.tl.FTLE(DT, 200, 5, method="dopri5")
+    dt.tl.FTLE(DT, 200, 5)
+    # the float32 grid only moves the particles reaching its edges
+    assert np.median(np.abs(DT.ftle - ftle)) < 1e-8
+    assert np.allclose(DT.ftle, ftle, rtol=0, atol=0.02 * np.abs(ftle).max())
+
+    # integer grid of a solid rotation
+    DT.X, DT.Y = np.meshgrid(np.arange(-5, 6), np.arange(-5, 6))
+    DT.u, DT.v = -DT.Y, DT.X
+    dt.tl.FTLE(DT, 1, 0.1)
+    assert DT.ftle.shape == (11, 11)
+    assert bilinear_interpolation(DT.X, DT.Y, DT.u.astype(np.float32), 1, 2.5) == -2.5
+
+
+def test_fit_ppt_unguarded_script(tmp_path):
+    import subprocess
+
+    script = tmp_path / "script.py"
+    script.write_text(
+        "import dyntrack as dt\n"
+        "DT = dt.ut.load_example()\n"
+        "dt.tl.fit_ppt(DT, [200, 201], n_jobs=2)\n"
+    )
+    res = subprocess.run(
+        [sys.executable, str(script)], capture_output=True, text=True, timeout=300
+    )
+    assert res.returncode != 0
+    assert "__main__" in res.stderr.splitlines()[-1]
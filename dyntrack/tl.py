@@ -1 +1,6 @@
-from .tools import *
+from ._lazy import attach
+from . import tools
+
+__getattr__, __dir__, __all__ = attach(__name__, dict.fromkeys(tools.__all__, ".tools"))
+
+del attach, tools
@@ -1,3 +1,13 @@
-from .vector_field import vector_field
-from .ftle import FTLE
-from .fit_ppt import fit_ppt
+from .._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    {
+        "vector_field": ".vector_field",
+        "VectorFieldSession": ".vector_field",
+        "FTLE": ".ftle",
+        "fit_ppt": ".fit_ppt",
+    },
+)
+
+del attach
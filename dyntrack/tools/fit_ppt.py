@@ -1,14 +1,45 @@
 from typing import Sequence, Union
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 from tqdm import tqdm
+import numpy as np
 import warnings
 import sys
+import os
+import tempfile
 import simpleppt
 from .. import logging as logg
 from .. import settings
+from ..utils.cache import cached
 from ..DynTrack import DynTrack
 
 simpleppt.settings.verbosity = 0
 
+_positions = None
+
+
+def _init_worker(positions):
+    global _positions
+    # workers receive the path of the positions and memory-map them
+    if isinstance(positions, str):
+        positions = np.load(positions, mmap_mode="r")
+    _positions = positions
+
+
+def _fit_frame(bounds, lam, sigma, kwargs):
+    tofit = np.array(_positions[bounds[0] : bounds[1]])
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return simpleppt.ppt(
+            tofit,
+            Nodes=tofit.shape[0],
+            lam=lam,
+            sigma=sigma,
+            progress=False,
+            **kwargs,
+        )
+
 
 def fit_ppt(
     DT: DynTrack,
@@ -16,9 +47,9 @@ def fit_ppt(
     lam: float = 10,
     sigma: float = 10,
     copy: bool = False,
+    n_jobs: int = 1,
     **kwargs,
 ):
-
     """\
     Compute a principal tree from partical position at each frame.
 
@@ -33,8 +64,13 @@ def fit_ppt(
     sigma
         Sigma parameter from SimplePPT algorithm.
     copy
-        Return a copy instead of writing to DT.
-    **kwargs
+        Return a copy instead of writing to DT. The arrays of DT are then
+        shared with the copy and made read-only, see :meth:`dyntrack.DynTrack.copy`.
+    n_jobs
+        Number of processes used to fit frames in parallel, -1 uses all cpus.
+        Processes are spawned and import the calling script again, which has
+        to call fit_ppt under an ``if __name__ == "__main__":`` guard.
+    **kwargs,
         Additional parameters to be passed to :func:`simpleppt.ppt`
 
     Returns
@@ -56,23 +92,61 @@ def fit_ppt(
     tdata = DT.track_data
 
     times = tdata.Time.unique() if times is None else times
-    ppts = []
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        for t in tqdm(times, file=sys.stdout, desc="    fitting"):
-            tofit = tdata.loc[tdata.Time == t, ["Position X", "Position Y"]]
-            ppts = ppts + [
-                simpleppt.ppt(
-                    tofit,
-                    Nodes=tofit.shape[0],
-                    lam=lam,
-                    sigma=sigma,
-                    progress=False,
-                    **kwargs,
-                )
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+
+    # frames are contiguous slices of the positions sorted by time
+    order, frames, offsets = DT.group_index("Time")
+    positions = tdata[["Position X", "Position Y"]].values[order].astype(float)
+    bounds = list(
+        zip(
+            offsets[np.searchsorted(frames, times, side="left")],
+            offsets[np.searchsorted(frames, times, side="right")],
+        )
+    )
+
+    def compute():
+        if n_jobs == 1:
+            _init_worker(positions)
+            return [
+                _fit_frame(b, lam, sigma, kwargs)
+                for b in tqdm(bounds, file=sys.stdout, desc="    fitting")
             ]
+        # spawn avoids inheriting locks held by numba or BLAS threads of the parent
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "positions.npy")
+                np.save(path, positions)
+                return fit_in_pool(path)
+        except BrokenProcessPool as err:
+            raise BrokenProcessPool(
+                "fitting processes stopped abruptly, scripts calling fit_ppt with "
+                "n_jobs > 1 must do it under an if __name__ == '__main__': guard"
+            ) from err
+
+    def fit_in_pool(path):
+        # passing the positions themselves to the workers can block forever
+        # when a worker fails to start, the parent writing them to its pipe
+        with ProcessPoolExecutor(
+            n_jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(path,),
+        ) as pool:
+            return list(
+                tqdm(
+                    pool.map(
+                        _fit_frame,
+                        bounds,
+                        *[[arg] * len(bounds) for arg in (lam, sigma, kwargs)],
+                        chunksize=max(1, len(bounds) // (4 * n_jobs)),
+                    ),
+                    total=len(bounds),
+                    file=sys.stdout,
+                    desc="    fitting",
+                )
+            )
 
-    DT.ppts = ppts
+    DT.ppts = cached("fit_ppt", compute, positions, bounds, lam, sigma, kwargs)
 
     logg.info("    finished", time=True, end=" " if settings.verbosity > 2 else "\n")
     logg.hint("added \n" "    .ppts, list of SimplePPT objects.")
@@ -1,10 +1,24 @@
+from typing import Literal, Optional, Sequence, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+import os
 import numpy as np
 from .. import logging as logg
 from .. import settings
 from ..utils.FTLE import *
+from ..utils.interpolate import velocity_at, as_float64
+from ..utils.cache import cached, key
 from ..DynTrack import DynTrack
-from tqdm import tqdm
-import itertools
+
+
+def seeds(X, Y):
+    """Returns the (N*N, 2) FTLE particles seeded on each grid point."""
+    return np.array(np.meshgrid(X[0, :], Y[:, 0])).T.reshape(-1, 2)
+
+
+def flow_map(traj, X):
+    """Returns the (N, N) x and y trajectories from the (N*N, 2) particles ones."""
+    N = np.shape(X[:, 1])[0]
+    return traj[:, 0].reshape(N, N).T, traj[:, 1].reshape(N, N).T
 
 
 def get_traj(X, Y, u, v, integration_time, dt, verbose=True):
@@ -16,20 +30,9 @@ def get_traj(X, Y, u, v, integration_time, dt, verbose=True):
     dt -- integral time step
     """
 
-    N = np.shape(X[:, 1])[0]
-    x = X[0, :]
-    y = Y[:, 0]
+    traj = integrate_batch(seeds(X, Y), integration_time, dt, X, Y, u, v)
 
-    xy = np.array(np.meshgrid(x, y)).T.reshape(-1, 2).tolist()
-    xy = list(map(np.array, xy))
-
-    res = [
-        integrate(x_y, integration_time, dt, X, Y, u, v)
-        for x_y in tqdm(xy, file=sys.stdout, desc="    integrating")
-    ]
-    res = np.array(res)
-
-    return res[:, 0].reshape(N, N).T, res[:, 1].T.reshape(N, N).T
+    return flow_map(traj, X)
 
 
 def get_ftle(traj_x, traj_y, X, Y, integration_time):
@@ -45,83 +48,88 @@ def get_ftle(traj_x, traj_y, X, Y, integration_time):
 
     """
 
-    N = np.shape(X[:, 0])[0]
-    ftle = np.zeros((N, N))
-
-    for i, j in itertools.product(range(0, N), range(0, N)):
-        # index 0:left, 1:right, 2:down, 3:up
-        xt = np.zeros(4)
-        yt = np.zeros(4)
-        xo = np.zeros(2)
-        yo = np.zeros(2)
-
-        if i == 0:
-            xt[0] = traj_x[j][i]
-            xt[1] = traj_x[j][i + 1]
-            yt[0] = traj_y[j][i]
-            yt[1] = traj_y[j][i + 1]
-            xo[0] = X[j][i]
-            xo[1] = X[j][i + 1]
-        elif i == N - 1:
-            xt[0] = traj_x[j][i - 1]
-            xt[1] = traj_x[j][i]
-            yt[0] = traj_y[j][i - 1]
-            yt[1] = traj_y[j][i]
-            xo[0] = X[j][i - 1]
-            xo[1] = X[j][i]
-        else:
-            xt[0] = traj_x[j][i - 1]
-            xt[1] = traj_x[j][i + 1]
-            yt[0] = traj_y[j][i - 1]
-            yt[1] = traj_y[j][i + 1]
-            xo[0] = X[j][i - 1]
-            xo[1] = X[j][i + 1]
-
-        if j == 0:
-            xt[2] = traj_x[j][i]
-            xt[3] = traj_x[j + 1][i]
-            yt[2] = traj_y[j][i]
-            yt[3] = traj_y[j + 1][i]
-            yo[0] = Y[j][i]
-            yo[1] = Y[j + 1][i]
-        elif j == N - 1:
-            xt[2] = traj_x[j - 1][i]
-            xt[3] = traj_x[j][i]
-            yt[2] = traj_y[j - 1][i]
-            yt[3] = traj_y[j][i]
-            yo[0] = Y[j - 1][i]
-            yo[1] = Y[j][i]
-        else:
-            xt[2] = traj_x[j - 1][i]
-            xt[3] = traj_x[j + 1][i]
-            yt[2] = traj_y[j - 1][i]
-            yt[3] = traj_y[j + 1][i]
-            yo[0] = Y[j - 1][i]
-            yo[1] = Y[j + 1][i]
-
-        lambdas = eigs(xt, yt, xo, yo)
-        if np.isnan(lambdas).all():
-            ftle[j][i] = float("nan")
-        else:
-            ftle[j][i] = 0.5 * np.log(max(lambdas)) / (integration_time)
+    with np.errstate(divide="ignore"):
+        ftle = 0.5 * np.log(max_cauchy_green(traj_x, traj_y, X, Y))
 
-    return ftle
+    return ftle / integration_time
 
 
-def FTLE(DT: DynTrack, integration_time: float, delta_t: float, copy: bool = False):
+def FTLE(
+    DT: DynTrack,
+    integration_time: Union[float, Sequence[float]],
+    delta_t: float,
+    copy: bool = False,
+    field: int = 0,
+    method: Literal["rk4", "dopri5"] = "rk4",
+    rtol: float = 1e-3,
+    atol: float = 1e-6,
+    resolution: Optional[Union[int, Tuple[int, int]]] = None,
+    tile_size: int = 128,
+    n_jobs: int = 1,
+    out: Optional[str] = None,
+    time_resolved: bool = False,
+    direction: Literal["forward", "backward", "both"] = "forward",
+    positions: Optional[Literal["sum", "end"]] = None,
+):
     """\
     Generate a scalar FTLE field from vector data.
 
+    The flow map reached at the longest integration time is kept, so that a
+    later call with a longer integration time continues from it instead of
+    integrating again from the start.
+
     Parameters
     ----------
     DT
         A :class:`dyntrack.DynTrack` object.
     integration_time
-        Overall integration time for sampling the vector field.
+        Overall integration time for sampling the vector field, or a list of
+        them to compute the FTLE at each one in a single integration.
     delta_t
-        Delta t used during the integration.
+        Delta t used during the integration, the initial one with `method="dopri5"`.
     copy
-        Return a copy instead of writing to DT.
+        Return a copy instead of writing to DT. The arrays of DT are then
+        shared with the copy and made read-only, see :meth:`dyntrack.DynTrack.copy`.
+    field
+        Index of the vector field to use, if several were fitted.
+    method
+        "rk4" integrates with fixed `delta_t` steps. "dopri5" adapts the step
+        size of each particle with an embedded Dormand-Prince scheme.
+    rtol
+        Relative tolerance of the local error with `method="dopri5"`.
+    atol
+        Absolute tolerance of the local error with `method="dopri5"`.
+    resolution
+        Number of seeds along y and x, or along both, spread over the extent of
+        the vector field grid. By default particles are seeded on the grid
+        points. Other resolutions are computed by tiles of rows, so that memory
+        is bounded by the size of the tiles and of the output.
+    tile_size
+        Number of rows of seeds integrated at once when `resolution` is given.
+    n_jobs
+        Number of tiles integrated in parallel, each on its own thread. With
+        one job, the seeds of each tile are integrated in parallel instead.
+    out
+        Directory where the FTLE of each integration time is written as a
+        memory-mapped `.npy` file, instead of being kept in memory. Implies
+        tiled computation.
+    time_resolved
+        Compute an FTLE field starting at each time window of the fields fitted
+        with `tl.vector_field(window=...)`, each window's field driving the
+        particles until the start of the next window. Flow maps over one window
+        step are integrated once, and composed by interpolation into the flow
+        maps over the integration time, which is rounded to a number of window
+        steps. Composing flow maps requires the FTLE to be derived from the
+        end positions of the particles, see `positions`.
+    direction
+        Integrate "forward" in time, revealing repelling structures,
+        "backward", revealing attracting ones, or "both", integrating the
+        seeds of both directions together in the same parallel kernels.
+    positions
+        Particle positions the FTLE is derived from, the "end" positions of
+        their trajectories, or the "sum" of their positions after each step,
+        as done originally, which only `method="rk4"` without `time_resolved`
+        supports. By default "sum" in that case and "end" otherwise.
 
     Returns
     -------
@@ -129,23 +137,363 @@ def FTLE(DT: DynTrack, integration_time: float, delta_t: float, copy: bool = Fal
         if `copy=True` it returns or else add fields to `DT`:
 
         `.ftle`
-            FTLE scalar values of the vector field.
+            FTLE scalar values of the vector field, at the last integration time,
+            forward unless `direction="backward"`. Values derived from summed
+            and from end positions are different quantities, only values with
+            the same `positions` can be compared.
+        `.ftles`
+            FTLE scalar values at each integration time.
+        `.ftle_fwd`
+            forward FTLE scalar values at the last integration time, if computed.
+        `.ftle_bwd`
+            backward FTLE scalar values at the last integration time, if computed.
+        `.flow_map`
+            state of the FTLE particles at the longest integration time, and the
+            total number of integration steps taken by all of them in `n_steps`.
+            Not updated when `resolution` or `out` is given.
+        `.ftle_grid`
+            x and y coordinates of the seeds when `resolution` or `out` is given.
+        `.ftle_t`
+            FTLE scalar values starting at each time window, if `time_resolved`,
+            derived from end positions.
+        `.ftle_times`
+            start time of each field of `.ftle_t`, the center of its window.
 
     """
 
     DT = DT.copy() if copy else DT
+    times = (
+        [integration_time] if np.isscalar(integration_time) else list(integration_time)
+    )
     logg.info(
-        "Obtaining FTLE scalar field (integration time: %s, delta t: %s)"
-        % (integration_time, delta_t),
+        "Obtaining FTLE scalar field (integration time: %s, delta t: %s, method: %s)"
+        % (", ".join(map(str, times)), delta_t, method),
         reset=True,
     )
-    traj_x, traj_y = get_traj(DT.X, DT.Y, DT.u, DT.v, integration_time, delta_t)
-    logg.info("    Calculating FTLE scalar field", end="... ")
-    ftle = get_ftle(traj_x, traj_y, DT.X, DT.Y, integration_time)
-    logg.info("done")
-    DT.ftle = ftle
+    u, v = DT.get_uv(field)
+    # the kernels are compiled for contiguous float64 arrays
+    xs, ys, u, v = as_float64(DT.X[0, :], DT.Y[:, 0], u, v)
+
+    if direction not in ["forward", "backward", "both"]:
+        raise ValueError(f"unknown integration direction {direction!r}")
+    directions = ["forward", "backward"] if direction == "both" else [direction]
+    sign = np.array([1.0 if d == "forward" else -1.0 for d in directions])
+
+    # integration progress, counted in steps for rk4 and in time for dopri5
+    if method == "rk4":
+        flow_key = key("flow_map", DT.X, DT.Y, u, v, delta_t, direction)
+        stop = lambda t: int(t / delta_t)
+    elif method == "dopri5":
+        flow_key = key(
+            "flow_map", DT.X, DT.Y, u, v, delta_t, direction, method, rtol, atol
+        )
+        stop = lambda t: float(t)
+    else:
+        raise ValueError(f"unknown integration method {method!r}")
+    stops = sorted({stop(t) for t in times})
+
+    if positions is None:
+        positions = "sum" if method == "rk4" and not time_resolved else "end"
+    if positions not in ["sum", "end"]:
+        raise ValueError(f"unknown particle positions {positions!r}")
+    if positions == "sum" and (method != "rk4" or time_resolved):
+        raise ValueError("summed positions require method='rk4' without time_resolved")
+
+    def initial_state(xy):
+        """Returns the state of the seeds xy, repeated for each direction."""
+        xy = np.tile(np.asarray(xy, dtype=np.float64), (len(directions), 1))
+        return np.hstack([xy, xy]) if method == "rk4" else xy
+
+    def step(state, start, end, serial=False, u=u, v=v):
+        """Integrates state from start to end, returns the number of steps."""
+        signs = np.repeat(sign, len(state) // len(sign))
+        if method == "rk4":
+            (advance_serial if serial else advance)(
+                state, end - start, delta_t, xs, ys, u, v, signs
+            )
+            return state.shape[0] * (end - start)
+        counts = np.zeros(state.shape[0], dtype=np.int64)
+        (advance_dopri_serial if serial else advance_dopri)(
+            state, end - start, delta_t, rtol, atol, xs, ys, u, v, counts, signs
+        )
+        return int(counts.sum())
+
+    def trajectories(state):
+        """Returns the (n, 2) trajectories of the seeds of each direction."""
+        traj = state[:, 2:] if positions == "sum" else state[:, :2]
+        return np.split(traj, len(directions))
+
+    def set_ftles(ftles):
+        DT.ftles = {t: ftles[t][0] for t in times}
+        DT.ftle = DT.ftles[times[-1]]
+        last = dict(zip(directions, ftles[times[-1]]))
+        DT.ftle_fwd, DT.ftle_bwd = last.get("forward"), last.get("backward")
+
+    if time_resolved:
+        if direction != "forward":
+            raise ValueError("time_resolved only supports direction='forward'")
+        if DT.u_t is None:
+            raise ValueError(
+                "no time windows were fitted, run tl.vector_field with window first"
+            )
+        if not np.isscalar(integration_time):
+            raise ValueError("time_resolved requires a single integration time")
+        starts = DT.time_windows[:, 0]
+        interval = starts[1] - starts[0] if len(starts) > 1 else np.ptp(DT.time_windows)
+        n_intervals = max(int(round(integration_time / interval)), 1)
+        n_frames = len(starts) - n_intervals + 1
+        if n_frames < 1:
+            raise ValueError(
+                f"integration time {integration_time} is longer than the "
+                f"{len(starts)} time windows of step {interval}"
+            )
+
+        xy = seeds(DT.X, DT.Y)
+
+        def compose(first, then):
+            """Returns the positions first (n, 2) mapped by the grid flow map then.
+
+            Displacements rather than positions are interpolated, so that
+            particles leaving the grid keep moving apart.
+            """
+            disp_x, disp_y = flow_map(then - xy, DT.X)
+            return first + velocity_at(xs, ys, disp_x, disp_y, first)
+
+        def compute():
+            logg.info(
+                "    Integrating %d flow maps over %s" % (len(starts), interval),
+                end="... ",
+            )
+            maps, n_steps = [], 0
+            for u_k, v_k in zip(DT.u_t, DT.v_t):
+                u_k, v_k = as_float64(u_k, v_k)
+                state = initial_state(xy)
+                n_steps += step(state, 0, stop(interval), u=u_k, v=v_k)
+                maps.append(trajectories(state)[0])
+            logg.info("done")
+            logg.info("    %d integration steps" % n_steps)
+
+            # maps over 2**j intervals, from pairs of maps over 2**(j-1)
+            logg.info("    Composing flow maps", end="... ")
+            levels = [maps]
+            while 2 ** len(levels) <= n_intervals:
+                previous, half = levels[-1], 2 ** (len(levels) - 1)
+                levels.append(
+                    [
+                        compose(previous[k], previous[k + half])
+                        for k in range(len(previous) - half)
+                    ]
+                )
+            ftle_t = np.empty((n_frames,) + DT.X.shape)
+            for k in range(n_frames):
+                traj, offset = None, k
+                for j, level in enumerate(levels):
+                    if n_intervals >> j & 1:
+                        traj = (
+                            level[offset]
+                            if traj is None
+                            else compose(traj, level[offset])
+                        )
+                        offset += 2**j
+                traj_x, traj_y = flow_map(traj, DT.X)
+                ftle_t[k] = get_ftle(traj_x, traj_y, DT.X, DT.Y, n_intervals * interval)
+            logg.info("done")
+            return ftle_t
+
+        DT.ftle_t = cached(
+            "FTLE_t",
+            compute,
+            DT.X,
+            DT.Y,
+            DT.u_t,
+            DT.v_t,
+            DT.time_windows,
+            integration_time,
+            delta_t,
+            method,
+            rtol,
+            atol,
+        )
+        DT.ftle_times = DT.time_windows[:n_frames].mean(axis=1)
+
+        logg.info(
+            "    finished", time=True, end=" " if settings.verbosity > 2 else "\n"
+        )
+        logg.hint(
+            "added \n"
+            "    .ftle_t, FTLE scalar values starting at each time window.\n"
+            "    .ftle_times, start time of each FTLE field."
+        )
+        return DT if copy else None
+
+    if resolution is not None or out is not None:
+        shape = (
+            DT.X.shape
+            if resolution is None
+            else tuple(np.broadcast_to(resolution, 2).astype(int))
+        )
+        gx = np.linspace(xs[0], xs[-1], shape[1])
+        gy = np.linspace(ys[0], ys[-1], shape[0])
+
+        def tile(ftles, rows):
+            """Computes the FTLE of rows, integrating one more row on each side."""
+            lo, hi = max(rows.start - 1, 0), min(rows.stop + 1, shape[0])
+            TX, TY = np.meshgrid(gx, gy[lo:hi])
+            state = initial_state(np.column_stack([TX.ravel(), TY.ravel()]))
+            done, n_steps = 0, 0
+            for end in stops:
+                n_steps += step(state, done, end, serial=n_jobs > 1)
+                done = end
+                for d, traj in enumerate(trajectories(state)):
+                    traj_x = traj[:, 0].reshape(TX.shape)
+                    traj_y = traj[:, 1].reshape(TX.shape)
+                    for t in times:
+                        if stop(t) == end:
+                            ftle = get_ftle(traj_x, traj_y, TX, TY, t)
+                            ftles[t][d][rows] = ftle[rows.start - lo : rows.stop - lo]
+            return n_steps
+
+        def compute():
+            logg.info(
+                "    Calculating FTLE scalar field on %dx%d seeds" % shape, end="... "
+            )
+            if out is None:
+                ftles = {t: [np.empty(shape) for d in directions] for t in times}
+            else:
+                os.makedirs(out, exist_ok=True)
+                names = {"forward": "ftle", "backward": "ftle_bwd"}
+                ftles = {
+                    t: [
+                        np.lib.format.open_memmap(
+                            os.path.join(out, f"{names[d]}_{t}.npy"),
+                            "w+",
+                            np.float64,
+                            shape,
+                        )
+                        for d in directions
+                    ]
+                    for t in times
+                }
+            tiles = [
+                slice(j, min(j + tile_size, shape[0]))
+                for j in range(0, shape[0], tile_size)
+            ]
+            if n_jobs == 1:
+                n_steps = sum(tile(ftles, rows) for rows in tiles)
+            else:
+                with ThreadPoolExecutor(n_jobs) as pool:
+                    n_steps = sum(pool.map(lambda rows: tile(ftles, rows), tiles))
+            if out is not None:
+                for ftle in ftles.values():
+                    for f in ftle:
+                        f.flush()
+            logg.info("done")
+            logg.info("    %d integration steps" % n_steps)
+            return ftles
+
+        if out is None:
+            ftles = cached(
+                "FTLE",
+                compute,
+                DT.X,
+                DT.Y,
+                u,
+                v,
+                sorted(times),
+                delta_t,
+                method,
+                rtol,
+                atol,
+                shape,
+                direction,
+                positions,
+            )
+        else:
+            ftles = compute()
+
+        set_ftles(ftles)
+        DT.ftle_grid = (gx, gy)
+
+        logg.info(
+            "    finished", time=True, end=" " if settings.verbosity > 2 else "\n"
+        )
+        logg.hint(
+            "added \n"
+            "    .ftle, FTLE scalar values of the vector field.\n"
+            "    .ftles, FTLE scalar values at each integration time.\n"
+            "    .ftle_fwd, .ftle_bwd, forward and backward FTLE scalar values.\n"
+            "    .ftle_grid, x and y coordinates of the FTLE seeds."
+        )
+        return DT if copy else None
+
+    def compute():
+        previous = DT.flow_map
+        if (
+            previous is not None
+            and previous["key"] == flow_key
+            and previous["end"] <= stops[0]
+        ):
+            logg.info("    continuing from integration time %s" % previous["time"])
+            state = np.array(previous["state"])
+            done, n_steps = previous["end"], previous["n_steps"]
+        else:
+            state = initial_state(seeds(DT.X, DT.Y))
+            done, n_steps = 0, 0
+
+        logg.info("    Calculating FTLE scalar field", end="... ")
+        ftles = {t: [] for t in times}
+        n_new = 0
+        for end in stops:
+            n_new += step(state, done, end)
+            done = end
+            for traj in trajectories(state):
+                traj_x, traj_y = flow_map(traj, DT.X)
+                for t in times:
+                    if stop(t) == end:
+                        ftles[t].append(get_ftle(traj_x, traj_y, DT.X, DT.Y, t))
+        logg.info("done")
+        logg.info("    %d integration steps" % n_new)
+        return ftles, state, n_steps + n_new
+
+    ftles, state, n_steps = cached(
+        "FTLE",
+        compute,
+        DT.X,
+        DT.Y,
+        u,
+        v,
+        sorted(times),
+        delta_t,
+        method,
+        rtol,
+        atol,
+        direction,
+        positions,
+    )
+
+    set_ftles(ftles)
+    DT.ftle_grid = None
+    if (
+        DT.flow_map is None
+        or DT.flow_map["key"] != flow_key
+        or (DT.flow_map["end"] < stops[-1])
+    ):
+        DT.flow_map = {
+            "key": flow_key,
+            "method": method,
+            "time": max(times),
+            "end": stops[-1],
+            "n_steps": n_steps,
+            "state": state,
+        }
 
     logg.info("    finished", time=True, end=" " if settings.verbosity > 2 else "\n")
-    logg.hint("added \n" "    .ftle, FTLE scalar values of the vector field.")
+    logg.hint(
+        "added \n"
+        "    .ftle, FTLE scalar values of the vector field.\n"
+        "    .ftles, FTLE scalar values at each integration time.\n"
+        "    .ftle_fwd, .ftle_bwd, forward and backward FTLE scalar values.\n"
+        "    .flow_map, state of the FTLE particles at the longest integration time."
+    )
 
     return DT if copy else None
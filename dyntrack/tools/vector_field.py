@@ -1,20 +1,27 @@
-from glob import glob
-import sys
-import os
-
-import subprocess
-import tempfile
-
-import pandas as pd
+from typing import Literal, Optional, Sequence, Union
 import numpy as np
+import pandas as pd
+import os
 
 from .. import settings
 from .. import logging as logg
 from ..DynTrack import DynTrack
+from ..utils import vfkm
+from ..utils.cache import cached
 
 
 def vector_field(
-    DT: DynTrack, gridRes: int = 30, smooth: float = 0.5, copy: float = False
+    DT: DynTrack,
+    gridRes: Union[int, Sequence[int]] = 30,
+    smooth: float = 0.5,
+    copy: float = False,
+    n_fields: int = 1,
+    n_jobs: int = 1,
+    tol: float = 1e-8,
+    max_iter: int = 10000,
+    preconditioner: Literal["none", "jacobi", "multigrid"] = "multigrid",
+    window: Optional[float] = None,
+    step: Optional[float] = None,
 ):
     """\
     Generate a grid vector field from track data.
@@ -24,11 +31,34 @@ def vector_field(
     DT
         A :class:`dyntrack.DynTrack` object.
     gridRes
-        grid resolution in both horizontal and vertical axis.
+        grid resolution in both horizontal and vertical axis. A sequence of
+        increasing resolutions, e.g. `[25, 50, 100, 200]`, solves each level
+        starting from the upsampled fields of the previous one.
     smooth
         Smooth parameter of the vfkm algorithm.
     copy
-        Return a copy instead of writing to DT.
+        Return a copy instead of writing to DT. The arrays of DT are then
+        shared with the copy and made read-only, see :meth:`dyntrack.DynTrack.copy`.
+    n_fields
+        Number of vector fields to fit, tracks are clustered between them.
+    n_jobs
+        Number of threads used to clip the tracks, assemble and fit the
+        vector fields, -1 uses all cpus.
+    tol
+        Relative residual tolerance of the conjugate gradient solver.
+    max_iter
+        Maximum number of conjugate gradient iterations per solve.
+    preconditioner
+        Preconditioner of the conjugate gradient solver.
+    window
+        Duration of sliding time windows to fit a vector field to, in addition
+        to the field of the whole recording. The tracks are clipped to the grid
+        once, and each window starts from the field of its previous one.
+        Windows are solved in `n_jobs` parallel runs of consecutive windows.
+        Requires `n_fields=1`.
+    step
+        Time between the starts of consecutive windows, half of `window` by
+        default.
 
     Returns
     -------
@@ -40,98 +70,227 @@ def vector_field(
         `.Y`
             y coordinates of the grid.
         `.u`
-            x component of the vectors.
+            x component of the vectors, stacked along the first axis if `n_fields > 1`.
         `.v`
-            y component of the vectors.
+            y component of the vectors, stacked along the first axis if `n_fields > 1`.
+        `.field_assignment`
+            vector field index and fitting error of each track.
+        `.vector_fields`
+            the fields above for each grid resolution, the finest one being
+            set on `DT`, and the number of conjugate gradient iterations of
+            each resolution in `"iterations"`.
+        `.u_t`
+            x component of the vectors of each time window, if `window` is set.
+        `.v_t`
+            y component of the vectors of each time window, if `window` is set.
+        `.time_windows`
+            start and end time of each time window, if `window` is set.
 
     """
 
     DT = DT.copy() if copy else DT
 
     tdata = DT.track_data
+    order = DT.group_index("Parent")[0]
 
-    allparents = np.unique(tdata["Parent"])
-    allparents = allparents[~np.isnan(allparents)]
-    ldata = list(
-        map(
-            lambda x: tdata[["Position X", "Position Y", "Time"]].loc[
-                tdata.index[
-                    tdata["Parent"].isin(
-                        [x],
-                    )
-                ]
-            ],
-            [par for par in allparents],
-        )
-    )
-
-    vfkm = settings.vfkm
+    n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
 
     logg.info(
-        f"Generating grid vector field with a {gridRes}x{gridRes} grid and a smoothing constrain of {smooth}",
+        f"Generating grid vector field with a {gridRes} grid resolution and a smoothing constrain of {smooth}",
         reset=True,
     )
-    with tempfile.TemporaryDirectory() as tmp:
-        # logg.hint("    Data temporary saved in "+tmp)
-        init = [
-            min(tdata["Position X"]),
-            max(tdata["Position X"]),
-            min(tdata["Position Y"]),
-            max(tdata["Position Y"]),
-            1,
-            max(tdata["Time"]),
-        ]
-        with open(tmp + "/tracks", "w") as f:
-            f.writelines(["%s " % item for item in init])
-        for ld in ldata:
-            ld.to_csv(tmp + "/tracks", mode="a", header=False, sep=" ", index=False)
-            pd.DataFrame([0, 0, 0]).transpose().to_csv(
-                tmp + "/tracks", header=False, sep=" ", mode="a", index=False
-            )
 
-        proc = subprocess.Popen(
-            vfkm
-            + " "
-            + tmp
-            + "/tracks "
-            + str(gridRes)
-            + " 1 "
-            + str(smooth)
-            + " "
-            + tmp,
-            stdout=subprocess.PIPE,
-            shell=True,
-        )
-        (out, err) = proc.communicate()
+    x = tdata["Position X"].values[order].astype(float)
+    y = tdata["Position Y"].values[order].astype(float)
+    t = tdata["Time"].values[order].astype(float)
+    parent = tdata["Parent"].values[order]
+    options = dict(tol=tol, cg_max_iter=max_iter, preconditioner=preconditioner)
 
-        files_c = [f for f in glob(tmp + "/*curves_r_*", recursive=True)]
-        files_v = [f for f in glob(tmp + "/*vf_r_*", recursive=True)]
-        curves = pd.read_table(files_c[0], header=None, sep=" ")
-        vect = pd.read_table(files_v[0], header=None, sep=" ", skiprows=1)
+    windows = None
+    if window is not None:
+        step = window / 2 if step is None else step
+        n = max(int(np.ceil((t.max() - t.min() - window) / step)) + 1, 1)
+        start = t.min() + step * np.arange(n)
+        windows = np.column_stack([start, start + window])
+        logg.info(f"    with {n} time windows of duration {window}")
 
-    gs = int(np.sqrt(vect.shape[0]))
+    def compute():
+        levels = vfkm.vfkm(
+            x, y, t, parent, gridRes, smooth, n_fields, n_jobs, windows, **options
+        )
+        vector_fields = {}
+        for res, X, Y, u, v, parent_c, field, error, iterations, u_t, v_t in levels:
+            vector_fields[res] = {
+                "X": X,
+                "Y": Y,
+                "u": u[0] if n_fields == 1 else u,
+                "v": v[0] if n_fields == 1 else v,
+                "field_assignment": pd.DataFrame(
+                    {"field": field, "error": error},
+                    index=pd.Index(parent_c, name="Parent"),
+                ),
+                "u_t": u_t,
+                "v_t": v_t,
+                "time_windows": None if u_t is None else windows,
+                "iterations": iterations,
+            }
+            logg.info(
+                f"    {res}x{res} grid solved with {iterations} conjugate gradient iterations"
+            )
+        return vector_fields
 
-    a = np.linspace(
-        min(pd.concat(ldata)["Position X"]), max(pd.concat(ldata)["Position X"]), gs
-    )
-    b = np.linspace(
-        min(pd.concat(ldata)["Position Y"]), max(pd.concat(ldata)["Position Y"]), gs
+    DT.vector_fields = cached(
+        "vector_field",
+        compute,
+        x,
+        y,
+        t,
+        parent,
+        gridRes,
+        smooth,
+        n_fields,
+        options,
+        windows,
     )
-    out = np.stack([each.ravel(order="C") for each in np.meshgrid(a, b)])
-
-    u = vect[0].values.reshape(gs, gs)
-    v = vect[1].values.reshape(gs, gs)
-    X, Y = np.meshgrid(a, b)
-
-    DT.X, DT.Y, DT.u, DT.v = X, Y, u, v
+    DT.select_vector_field(list(DT.vector_fields)[-1])
 
     logg.info("    finished", time=True, end=" " if settings.verbosity > 2 else "\n")
-    logg.hint(
+    hint = (
         "added \n"
         "    .X, x coordinates of the grid\n"
         "    .Y, y coordinates of the grid\n"
         "    .u, x component of the vectors\n"
-        "    .v, y component of the vectors"
+        "    .v, y component of the vectors\n"
+        "    .field_assignment, vector field index and error of each track\n"
+        "    .vector_fields, vector fields for each grid resolution"
     )
+    if windows is not None:
+        hint += (
+            "\n    .u_t, x component of the vectors of each time window\n"
+            "    .v_t, y component of the vectors of each time window\n"
+            "    .time_windows, start and end time of each time window"
+        )
+    logg.hint(hint)
 
     return DT if copy else None
+
+
+class VectorFieldSession:
+    """\
+    Vector field solver reusing the tracks description across solves.
+
+    The tracks are clipped to the grid, and the smoothness independent parts
+    of the linear systems are assembled, once when creating the session.
+    Each call to :meth:`solve` then only solves the systems, starting from the
+    fields of the previous solve, which makes sweeps over `smooth` cheap.
+
+    Parameters
+    ----------
+    DT
+        A :class:`dyntrack.DynTrack` object.
+    gridRes
+        grid resolution in both horizontal and vertical axis.
+    n_jobs
+        Number of threads used to clip the tracks, assemble and fit the
+        vector fields, -1 uses all cpus.
+    tol
+        Relative residual tolerance of the conjugate gradient solver.
+    max_iter
+        Maximum number of conjugate gradient iterations per solve.
+    preconditioner
+        Preconditioner of the conjugate gradient solver.
+
+    Attributes
+    ----------
+    X
+        x coordinates of the grid.
+    Y
+        y coordinates of the grid.
+
+    """
+
+    def __init__(
+        self,
+        DT: DynTrack,
+        gridRes: int = 30,
+        n_jobs: int = 1,
+        tol: float = 1e-8,
+        max_iter: int = 10000,
+        preconditioner: Literal["none", "jacobi", "multigrid"] = "multigrid",
+    ):
+        tdata = DT.track_data
+        order = DT.group_index("Parent")[0]
+        x = tdata["Position X"].values[order].astype(float)
+        y = tdata["Position Y"].values[order].astype(float)
+
+        self.gridRes = gridRes
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.options = dict(
+            tol=tol, cg_max_iter=max_iter, preconditioner=preconditioner
+        )
+
+        self.grid = vfkm.Grid(
+            x.min(), y.min(), x.max() - x.min(), y.max() - y.min(), gridRes
+        )
+        self.cd = vfkm.curve_description(
+            self.grid,
+            x,
+            y,
+            tdata["Time"].values[order].astype(float),
+            tdata["Parent"].values[order],
+            n_jobs=self.n_jobs,
+        )
+        self.L2 = self.grid.laplacian() @ self.grid.laplacian()
+        self.data = vfkm.data_term(self.grid, self.cd, n_jobs=self.n_jobs)
+        self.X, self.Y = self.grid.meshgrid()
+        self._last = {}
+
+    def solve(self, smooth: float = 0.5, n_fields: int = 1):
+        """\
+        Fit vector fields with the given smoothness.
+
+        Parameters
+        ----------
+        smooth
+            Smooth parameter of the vfkm algorithm.
+        n_fields
+            Number of vector fields to fit, tracks are clustered between them.
+
+        Returns
+        -------
+        u, v, field_assignment, iterations
+            x and y components of the vectors, stacked along the first axis if
+            `n_fields > 1`, the vector field index and fitting error of each
+            track, and the number of conjugate gradient iterations.
+
+        """
+        u0, v0 = self._last.get(n_fields, (None, None))
+        us, vs, field, error, iterations = vfkm.optimize(
+            self.grid,
+            self.cd,
+            n_fields,
+            smooth,
+            self.n_jobs,
+            u0=u0,
+            v0=v0,
+            L2=self.L2,
+            data=self.data,
+            **self.options,
+        )
+        self._last[n_fields] = us, vs
+        logg.msg(
+            f"smooth={smooth} solved with {iterations} conjugate gradient iterations",
+            v=4,
+        )
+
+        shape = (n_fields, self.gridRes, self.gridRes)
+        u, v = us.reshape(shape), vs.reshape(shape)
+        field_assignment = pd.DataFrame(
+            {"field": field, "error": error},
+            index=pd.Index(self.cd.parent, name="Parent"),
+        )
+        return (
+            (u[0], v[0], field_assignment, iterations)
+            if n_fields == 1
+            else (u, v, field_assignment, iterations)
+        )
@@ -1 +1,6 @@
-from .utils import *
+from ._lazy import attach
+from . import utils
+
+__getattr__, __dir__, __all__ = attach(__name__, dict.fromkeys(utils.__all__, ".utils"))
+
+del attach, utils
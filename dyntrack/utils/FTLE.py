@@ -1,12 +1,19 @@
 import numpy as np
 import math
-from matplotlib import pyplot
 import time
 import sys
 import numba
+from numba import float64, int64, types
+from .interpolate import (
+    interpolate,
+    as_float64,
+    _locate,
+    _interpolate_cell,
+    _axis,
+    _grid,
+)
 
 
-@numba.jit
 def bilinear_interpolation(X, Y, f, x, y):
     """Returns the approximate value of f(x,y) using bilinear interpolation.
 
@@ -17,120 +24,389 @@ def bilinear_interpolation(X, Y, f, x, y):
     x, y -- coordinates where to compute f(x,y)
 
     """
+    xs, ys, f = as_float64(X[0, :], Y[:, 0], f)
+    return interpolate(xs, ys, f, float(x), float(y))
 
-    N = np.shape(X[:, 0])[0]
 
-    dx, dy = X[0, 1] - X[0, 0], Y[1, 0] - Y[0, 0]
-    x_start, y_start = X[0, 0], Y[0, 0]
+@numba.njit(
+    float64(_axis, _axis, float64, float64, _grid, float64, int64, float64), cache=True
+)
+def _rk4(xs, ys, x, y, f, h, dim, sign):
+    """rk4 on the grid axes xs, ys instead of the mesh grid, of the function
+    f multiplied by sign."""
+    k1 = h * (sign * interpolate(xs, ys, f, x, y))
+    k2 = h * (sign * interpolate(xs, ys, f, x + 0.5 * h, y + 0.5 * k1))
+    k3 = h * (sign * interpolate(xs, ys, f, x + 0.5 * h, y + 0.5 * k2))
+    k4 = h * (sign * interpolate(xs, ys, f, x + h, y + k3))
+
+    if dim == 0:
+        return x + 1.0 / 6 * k1 + 1.0 / 3 * k2 + 1.0 / 3 * k3 + 1.0 / 6 * k4
+    elif dim == 1:
+        return y + 1.0 / 6 * k1 + 1.0 / 3 * k2 + 1.0 / 3 * k3 + 1.0 / 6 * k4
+    else:
+        print("invalid dimension parameter passed to rk4, exiting")
+        # sys.exit()
+        return math.nan
 
-    i1, i2 = int((x - x_start) / dx), int((x - x_start) / dx) + 1
-    j1, j2 = int((y - y_start) / dy), int((y - y_start) / dy) + 1
 
-    # Take care of boundaries
+def rk4(X, Y, x, y, f, h, dim):
+    """Returns the approximate value of f(x,y) using bilinear interpolation.
 
-    # 1. Right boundary
+    Arguments
+    ---------
+    X, Y -- mesh grid.
+    x, y -- coordinates where to begin the evolution.
+    f -- the function f that will be evolved.
+    h -- the time step (usually referred to this as dt.)
+    dim -- 0 for x and 1 for y.
 
-    if i1 >= N - 1 and j1 <= N - 1 and j1 >= 0:
-        return f[j1, N - 1]
-    if i1 >= N - 1 and j1 <= 0:
-        return f[0, N - 1]
-    if i1 >= N - 1 and j1 >= N - 1:
-        return f[N - 1, N - 1]
+    """
+    xs, ys, f = as_float64(X[0, :], Y[:, 0], f)
+    return _rk4(xs, ys, float(x), float(y), f, float(h), int(dim), 1.0)
+
+
+@numba.njit(
+    types.List(float64)(float64, float64, int64, float64, _axis, _axis, _grid, _grid),
+    cache=True,
+)
+def _integrate(x, y, n_steps, dt, xs, ys, u, v):
+    tr_x = x
+    tr_y = y
+    for k in range(n_steps):
+        x, y = _rk4(xs, ys, x, y, u, dt, 0, 1.0), _rk4(xs, ys, x, y, v, dt, 1, 1.0)
+        tr_x += x
+        tr_y += y
+    return [tr_x, tr_y]
 
-    # 2. Left boundary
 
-    if i1 <= 0 and j1 <= N - 1 and j1 >= 0:
-        return f[j1, 0]
-    if i1 <= 0 and j1 <= 0:
-        return f[0, 0]
-    if i1 <= 0 and j1 >= N - 1:
-        return f[N - 1, 0]
+def integrate(x_y, integration_time, dt, X, Y, u, v):
+    xs, ys, u, v = as_float64(X[0, :], Y[:, 0], u, v)
+    n_steps = int(integration_time / dt)
+    return _integrate(float(x_y[0]), float(x_y[1]), n_steps, float(dt), xs, ys, u, v)
+
+
+_state = types.Array(float64, 2, "A")
+
+
+@numba.njit(
+    types.void(_state, int64, int64, float64, _axis, _axis, _grid, _grid, float64),
+    cache=True,
+)
+def _advance_seed(state, n, n_steps, dt, xs, ys, u, v, sign):
+    """Integrates the seed n of state, see advance."""
+    x, y = state[n, 0], state[n, 1]
+    tr_x, tr_y = state[n, 2], state[n, 3]
+    for k in range(n_steps):
+        x, y = _rk4(xs, ys, x, y, u, dt, 0, sign), _rk4(xs, ys, x, y, v, dt, 1, sign)
+        tr_x += x
+        tr_y += y
+    state[n, 0], state[n, 1] = x, y
+    state[n, 2], state[n, 3] = tr_x, tr_y
+
+
+@numba.njit(
+    types.void(_state, int64, float64, _axis, _axis, _grid, _grid, _axis),
+    parallel=True,
+    cache=True,
+)
+def advance(state, n_steps, dt, xs, ys, u, v, signs):
+    """Integrates n_steps further all seed points, in parallel over seeds.
 
-    # 3. Top boundary
+    Arguments
+    ---------
+    state -- (N, 4) array of the current x, y coordinates of each seed and of
+    the sums of their positions along the trajectory, updated in place.
+    n_steps -- number of integration steps.
+    dt -- integral time step.
+    xs, ys -- x and y coordinates of the grid.
+    u, v -- x and y components of the vector field.
+    signs -- (N,) 1 to integrate each seed forward in time, -1 backward.
 
-    if j1 >= N - 1 and i1 <= N - 1 and i1 >= 0:
-        return f[N - 1, i1]
-    if j1 >= N - 1 and i1 <= 0:
-        return f[N - 1, 0]
+    """
+    for n in numba.prange(state.shape[0]):
+        _advance_seed(state, n, n_steps, dt, xs, ys, u, v, signs[n])
 
-    # 3. Bottom boundary
 
-    if j1 <= 0 and i1 <= N - 1 and i1 >= 0:
-        return f[0, i1]
-    if j1 <= 0 and i1 >= N - 1:
-        return f[N - 1, 0]
+@numba.njit(
+    types.void(_state, int64, float64, _axis, _axis, _grid, _grid, _axis),
+    nogil=True,
+    cache=True,
+)
+def advance_serial(state, n_steps, dt, xs, ys, u, v, signs):
+    """advance on a single thread, releasing the GIL to run batches in threads."""
+    for n in range(state.shape[0]):
+        _advance_seed(state, n, n_steps, dt, xs, ys, u, v, signs[n])
 
-    x1, x2 = X[j1, i1], X[j2, i2]
-    y1, y2 = Y[j1, i1], Y[j2, i2]
 
-    f_interpolated = (
-        1
-        / (x2 - x1)
-        * 1
-        / (y2 - y1)
-        * (
-            f[j1, i1] * (x2 - x) * (y2 - y)
-            + f[j1, i2] * (x - x1) * (y2 - y)
-            + f[j2, i1] * (x2 - x) * (y - y1)
-            + f[j2, i2] * (x - x1) * (y - y1)
-        )
-    )
+def integrate_batch(xy, integration_time, dt, X, Y, u, v):
+    """Integrates all seed points at once, in parallel over seeds.
 
-    return f_interpolated
+    Arguments
+    ---------
+    xy -- (N, 2) array of seed coordinates.
+    integration_time -- overall integration time.
+    dt -- integral time step.
+    X, Y -- mesh grid.
+    u, v -- x and y components of the vector field.
 
+    """
+    state = np.hstack([xy, xy]).astype(np.float64)
+    signs = np.ones(len(state))
+    xs, ys, u, v = as_float64(X[0, :], Y[:, 0], u, v)
+    advance(state, int(integration_time / dt), dt, xs, ys, u, v, signs)
+    return state[:, 2:].copy()
+
+
+@numba.njit(
+    types.UniTuple(float64, 2)(_axis, _axis, _grid, _grid, float64, float64, float64),
+    cache=True,
+)
+def _velocity(xs, ys, u, v, sign, x, y):
+    i1, j1 = _locate(xs, ys, x, y)
+    return (
+        sign * _interpolate_cell(xs, ys, u, i1, j1, x, y),
+        sign * _interpolate_cell(xs, ys, v, i1, j1, x, y),
+    )
 
-@numba.jit
-def rk4(X, Y, x, y, f, h, dim):
-    """Returns the approximate value of f(x,y) using bilinear interpolation.
+
+@numba.njit(
+    int64(
+        _state,
+        int64,
+        float64,
+        float64,
+        float64,
+        float64,
+        _axis,
+        _axis,
+        _grid,
+        _grid,
+        float64,
+    ),
+    cache=True,
+)
+def _dopri_seed(pos, n, duration, h0, rtol, atol, xs, ys, u, v, sign):
+    """Integrates the seed n of pos, returns its number of steps, see advance_dopri."""
+    x, y = pos[n, 0], pos[n, 1]
+    t, h = 0.0, min(h0, duration)
+    n_steps = 0
+    k1x, k1y = _velocity(xs, ys, u, v, sign, x, y)
+    while t < duration:
+        h = min(h, duration - t)
+        k2x, k2y = _velocity(
+            xs, ys, u, v, sign, x + h * (1 / 5 * k1x), y + h * (1 / 5 * k1y)
+        )
+        k3x, k3y = _velocity(
+            xs,
+            ys,
+            u,
+            v,
+            sign,
+            x + h * (3 / 40 * k1x + 9 / 40 * k2x),
+            y + h * (3 / 40 * k1y + 9 / 40 * k2y),
+        )
+        k4x, k4y = _velocity(
+            xs,
+            ys,
+            u,
+            v,
+            sign,
+            x + h * (44 / 45 * k1x - 56 / 15 * k2x + 32 / 9 * k3x),
+            y + h * (44 / 45 * k1y - 56 / 15 * k2y + 32 / 9 * k3y),
+        )
+        k5x, k5y = _velocity(
+            xs,
+            ys,
+            u,
+            v,
+            sign,
+            x
+            + h
+            * (
+                19372 / 6561 * k1x
+                - 25360 / 2187 * k2x
+                + 64448 / 6561 * k3x
+                - 212 / 729 * k4x
+            ),
+            y
+            + h
+            * (
+                19372 / 6561 * k1y
+                - 25360 / 2187 * k2y
+                + 64448 / 6561 * k3y
+                - 212 / 729 * k4y
+            ),
+        )
+        k6x, k6y = _velocity(
+            xs,
+            ys,
+            u,
+            v,
+            sign,
+            x
+            + h
+            * (
+                9017 / 3168 * k1x
+                - 355 / 33 * k2x
+                + 46732 / 5247 * k3x
+                + 49 / 176 * k4x
+                - 5103 / 18656 * k5x
+            ),
+            y
+            + h
+            * (
+                9017 / 3168 * k1y
+                - 355 / 33 * k2y
+                + 46732 / 5247 * k3y
+                + 49 / 176 * k4y
+                - 5103 / 18656 * k5y
+            ),
+        )
+        nx = x + h * (
+            35 / 384 * k1x
+            + 500 / 1113 * k3x
+            + 125 / 192 * k4x
+            - 2187 / 6784 * k5x
+            + 11 / 84 * k6x
+        )
+        ny = y + h * (
+            35 / 384 * k1y
+            + 500 / 1113 * k3y
+            + 125 / 192 * k4y
+            - 2187 / 6784 * k5y
+            + 11 / 84 * k6y
+        )
+        k7x, k7y = _velocity(xs, ys, u, v, sign, nx, ny)
+
+        # difference between the 5th and the embedded 4th order solutions
+        ex = h * (
+            71 / 57600 * k1x
+            - 71 / 16695 * k3x
+            + 71 / 1920 * k4x
+            - 17253 / 339200 * k5x
+            + 22 / 525 * k6x
+            - 1 / 40 * k7x
+        )
+        ey = h * (
+            71 / 57600 * k1y
+            - 71 / 16695 * k3y
+            + 71 / 1920 * k4y
+            - 17253 / 339200 * k5y
+            + 22 / 525 * k6y
+            - 1 / 40 * k7y
+        )
+        sx = atol + rtol * max(abs(x), abs(nx))
+        sy = atol + rtol * max(abs(y), abs(ny))
+        err = math.sqrt(0.5 * ((ex / sx) ** 2 + (ey / sy) ** 2))
+        if not math.isfinite(err):
+            # undefined velocities, the step size would never settle
+            x = y = math.nan
+            break
+
+        if err <= 1.0 or h <= 1e-12 * duration:
+            t += h
+            x, y = nx, ny
+            k1x, k1y = k7x, k7y
+            n_steps += 1
+        factor = 5.0 if err == 0.0 else 0.9 * err**-0.2
+        h *= min(5.0, max(0.2, factor))
+    pos[n, 0], pos[n, 1] = x, y
+    return n_steps
+
+
+@numba.njit(
+    types.void(
+        _state,
+        float64,
+        float64,
+        float64,
+        float64,
+        _axis,
+        _axis,
+        _grid,
+        _grid,
+        int64[::1],
+        _axis,
+    ),
+    parallel=True,
+    cache=True,
+)
+def advance_dopri(pos, duration, h0, rtol, atol, xs, ys, u, v, steps, signs):
+    """Integrates all seed points over duration with adaptive Dormand-Prince steps.
+
+    Each seed adapts its own step size so that the local error estimate of
+    the embedded 4th order solution stays below atol + rtol * |position|.
 
     Arguments
     ---------
-    X, Y -- mesh grid.
-    x, y -- coordinates where to begin the evolution.
-    f -- the function f that will be evolved.
-    h -- the time step (usually referred to this as dt.)
-    dim -- 0 for x and 1 for y.
+    pos -- (N, 2) array of x, y coordinates of each seed, updated in place.
+    duration -- integration time.
+    h0 -- initial time step.
+    rtol, atol -- relative and absolute tolerances.
+    xs, ys -- x and y coordinates of the grid.
+    u, v -- x and y components of the vector field.
+    steps -- (N,) number of accepted steps of each seed, incremented in place.
+    signs -- (N,) 1 to integrate each seed forward in time, -1 backward.
 
     """
+    for n in numba.prange(pos.shape[0]):
+        steps[n] += _dopri_seed(
+            pos, n, duration, h0, rtol, atol, xs, ys, u, v, signs[n]
+        )
 
-    k1 = h * bilinear_interpolation(X, Y, f, x, y)
-    k2 = h * bilinear_interpolation(X, Y, f, x + 0.5 * h, y + 0.5 * k1)
-    k3 = h * bilinear_interpolation(X, Y, f, x + 0.5 * h, y + 0.5 * k2)
-    k4 = h * bilinear_interpolation(X, Y, f, x + h, y + k3)
 
-    if dim == 0:
-        return x + 1.0 / 6 * k1 + 1.0 / 3 * k2 + 1.0 / 3 * k3 + 1.0 / 6 * k4
-    elif dim == 1:
-        return y + 1.0 / 6 * k1 + 1.0 / 3 * k2 + 1.0 / 3 * k3 + 1.0 / 6 * k4
-    else:
-        print("invalid dimension parameter passed to rk4, exiting")
-        # sys.exit()
+@numba.njit(
+    types.void(
+        _state,
+        float64,
+        float64,
+        float64,
+        float64,
+        _axis,
+        _axis,
+        _grid,
+        _grid,
+        int64[::1],
+        _axis,
+    ),
+    nogil=True,
+    cache=True,
+)
+def advance_dopri_serial(pos, duration, h0, rtol, atol, xs, ys, u, v, steps, signs):
+    """advance_dopri on a single thread, releasing the GIL to run batches in threads."""
+    for n in range(pos.shape[0]):
+        steps[n] += _dopri_seed(
+            pos, n, duration, h0, rtol, atol, xs, ys, u, v, signs[n]
+        )
 
 
-@numba.jit
-def integrate(x_y, integration_time, dt, X, Y, u, v):
-    xs = x_y[0]
-    ys = x_y[1]
-    tr_x = xs
-    tr_y = ys
-    for k in range(0, int(integration_time / dt)):
-        xs, ys = rk4(X, Y, xs, ys, u, dt, 0), rk4(X, Y, xs, ys, v, dt, 1)
-        tr_x += xs
-        tr_y += ys
-    return [tr_x, tr_y]
+def _diff(f, x, axis):
+    """Central differences of f over x along axis, one-sided at the edges."""
+    f, x = np.moveaxis(f, axis, 0), np.moveaxis(x, axis, 0)
+    d = np.empty(f.shape)
+    d[1:-1] = (f[2:] - f[:-2]) / (x[2:] - x[:-2])
+    d[0] = (f[1] - f[0]) / (x[1] - x[0])
+    d[-1] = (f[-1] - f[-2]) / (x[-1] - x[-2])
+    return np.moveaxis(d, 0, axis)
 
 
-def eigs(xt, yt, xo, yo):
-    ftlemat = np.zeros((2, 2))
-    ftlemat[0][0] = (xt[1] - xt[0]) / (xo[1] - xo[0])
-    ftlemat[1][0] = (yt[1] - yt[0]) / (xo[1] - xo[0])
-    ftlemat[0][1] = (xt[3] - xt[2]) / (yo[1] - yo[0])
-    ftlemat[1][1] = (yt[3] - yt[2]) / (yo[1] - yo[0])
+def max_cauchy_green(traj_x, traj_y, X, Y):
+    """Returns the largest eigenvalue of the Cauchy-Green tensor at each cell.
 
-    if True in np.isnan(ftlemat):
-        return "nan"
+    Arguments
+    ---------
+    traj_x, traj_y -- flow map, the trajectories of the FTLE particles.
+    X, Y -- mesh grid.
+
+    """
+    a = _diff(traj_x, X, 1)
+    b = _diff(traj_x, Y, 0)
+    c = _diff(traj_y, X, 1)
+    d = _diff(traj_y, Y, 0)
 
-    ftlemat = np.dot(ftlemat.transpose(), ftlemat)
-    w, v = np.linalg.eig(ftlemat)
+    # C = F^T F is symmetric, [[p, q], [q, r]]
+    p = a * a + c * c
+    q = a * b + c * d
+    r = b * b + d * d
 
-    return w
+    return 0.5 * (p + r) + np.sqrt(0.25 * (p - r) ** 2 + q * q)
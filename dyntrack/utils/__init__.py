@@ -1 +1,14 @@
-from .load_data import load_data, load_example
+from .._lazy import attach
+
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    {
+        "load_data": ".load_data",
+        "load_example": ".load_data",
+        "read": ".storage",
+        "write": ".storage",
+        "warmup": ".warmup",
+    },
+)
+
+del attach
@@ -0,0 +1,135 @@
+"""On-disk cache of the results of the tools.
+
+Results are pickled in ``settings.cachedir`` under the hash of the inputs and
+parameters they were computed from. Reading a result refreshes its
+modification time, and the least recently used results are evicted when the
+directory grows past ``settings.cachesize`` bytes.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .. import settings
+from .. import logging as logg
+
+
+def _update(h, obj):
+    """Feeds obj to the hash h, recursing into containers."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        _update(h, list(obj.columns) if obj.ndim == 2 else obj.name)
+        _update(h, obj.values)
+    elif isinstance(obj, np.ndarray) and obj.dtype != object:
+        h.update(f"{obj.dtype.str}{obj.shape}".encode())
+        h.update(memoryview(np.ascontiguousarray(obj)).cast("B"))
+    elif isinstance(obj, np.ndarray):
+        h.update(pickle.dumps(obj))
+    elif isinstance(obj, dict):
+        h.update(b"{")
+        for k in sorted(obj, key=repr):
+            _update(h, k)
+            _update(h, obj[k])
+        h.update(b"}")
+    elif isinstance(obj, (list, tuple, range)):
+        h.update(b"[")
+        for o in obj:
+            _update(h, o)
+        h.update(b"]")
+    else:
+        h.update(f"{type(obj).__name__}:{obj!r};".encode())
+
+
+def key(tool, *inputs):
+    """Returns the hexadecimal hash of a tool name and its inputs."""
+    from .. import __version__
+
+    h = hashlib.sha256()
+    _update(h, (tool, __version__) + inputs)
+    return h.hexdigest()
+
+
+def _path(k):
+    return os.path.join(settings.cachedir, f"{k}.pkl")
+
+
+def load(k):
+    """Returns whether k is cached and its value, marking it as recently used."""
+    path = _path(k)
+    try:
+        with open(path, "rb") as f:
+            value = pickle.load(f)
+    except FileNotFoundError:
+        return False, None
+    except Exception:
+        # truncated or unreadable entry, recompute it
+        _remove(path)
+        return False, None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return True, value
+
+
+def store(k, value):
+    """Writes value under k, then evicts the least recently used entries."""
+    os.makedirs(settings.cachedir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=settings.cachedir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, _path(k))
+    evict(settings.cachesize)
+
+
+def _remove(path):
+    # another process sharing the cache directory may have removed it already
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def evict(max_size):
+    """Removes the least recently used entries until the cache fits max_size."""
+    entries = []
+    for entry in os.scandir(settings.cachedir):
+        if entry.name.endswith(".pkl"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    size = sum(e[1] for e in entries)
+    for _, entry_size, path in sorted(entries):
+        if size <= max_size:
+            break
+        _remove(path)
+        size -= entry_size
+
+
+def cached(tool, compute, *inputs):
+    """Returns compute(), loaded from the cache when enabled and available.
+
+    Arguments
+    ---------
+    tool -- name of the tool, part of the key.
+    compute -- function computing the result without arguments.
+    inputs -- arrays and parameters the result depends on.
+
+    """
+    if settings.cachedir is None:
+        return compute()
+
+    k = key(tool, *inputs)
+    hit, value = load(k)
+    if hit:
+        logg.info("    loaded from cache")
+        return value
+
+    value = compute()
+    store(k, value)
+    return value
@@ -0,0 +1,52 @@
+import math
+import numba
+from numba import float64, types
+
+_segments = types.Array(float64, 3, "A", readonly=True)
+_values = types.Array(float64, 2, "A", readonly=True)
+
+
+@numba.njit(
+    types.void(
+        _segments, _values, float64, float64, float64, float64, float64[:, :, ::1]
+    ),
+    nogil=True,
+    cache=True,
+)
+def rasterize(segments, values, x0, y0, sx, sy, out):
+    """Accumulates segments and their values on the pixels they go through.
+
+    Each segment is sampled at both ends and at least once per pixel along its
+    longest axis, and counted once in each distinct pixel visited.
+
+    Arguments
+    ---------
+    segments -- (n, 2, 2) x and y coordinates of the ends of each segment.
+    values -- (n, k) values of each segment.
+    x0, y0 -- coordinates of the lower left corner of the pixel grid.
+    sx, sy -- width and height of the pixels.
+    out -- (ny, nx, k + 1) counts and sums of the values of each pixel,
+    incremented in place.
+
+    """
+    ny, nx = out.shape[0], out.shape[1]
+    for s in range(segments.shape[0]):
+        ax = (segments[s, 0, 0] - x0) / sx
+        ay = (segments[s, 0, 1] - y0) / sy
+        dx = (segments[s, 1, 0] - x0) / sx - ax
+        dy = (segments[s, 1, 1] - y0) / sy - ay
+        length = max(abs(dx), abs(dy))
+        if not math.isfinite(length):
+            continue
+        n = max(int(math.ceil(length)), 1)
+        pi, pj = -1, -1
+        for k in range(n + 1):
+            t = k / n
+            i = int(math.floor(ay + t * dy))
+            j = int(math.floor(ax + t * dx))
+            if (i == pi and j == pj) or i < 0 or i >= ny or j < 0 or j >= nx:
+                continue
+            pi, pj = i, j
+            out[i, j, 0] += 1
+            for v in range(values.shape[1]):
+                out[i, j, v + 1] += values[s, v]
@@ -0,0 +1,116 @@
+import numpy as np
+import numba
+from numba import float64, int64, types
+
+# kernels are compiled for read-only arrays, which writeable ones convert to
+_axis = types.Array(float64, 1, "A", readonly=True)
+_grid = types.Array(float64, 2, "A", readonly=True)
+
+
+@numba.njit(types.UniTuple(int64, 2)(_axis, _axis, float64, float64), cache=True)
+def _locate(xs, ys, x, y):
+    """Returns the indices i, j of the lower left corner of the cell of (x, y)."""
+    return int((x - xs[0]) / (xs[1] - xs[0])), int((y - ys[0]) / (ys[1] - ys[0]))
+
+
+@numba.njit(float64(_axis, _axis, _grid, int64, int64, float64, float64), cache=True)
+def _interpolate_cell(xs, ys, f, i1, j1, x, y):
+    """Returns f(x, y), (x, y) being in the cell of lower left corner i1, j1.
+
+    Cells along the grid edges take the value of their edge vertex.
+    """
+    ny, nx = f.shape
+    if i1 >= nx - 1:
+        return f[min(max(j1, 0), ny - 1), nx - 1]
+    if i1 <= 0:
+        return f[min(max(j1, 0), ny - 1), 0]
+    if j1 >= ny - 1:
+        return f[ny - 1, i1]
+    if j1 <= 0:
+        return f[0, i1]
+
+    i2, j2 = i1 + 1, j1 + 1
+    x1, x2 = xs[i1], xs[i2]
+    y1, y2 = ys[j1], ys[j2]
+
+    return (
+        1
+        / (x2 - x1)
+        * 1
+        / (y2 - y1)
+        * (
+            f[j1, i1] * (x2 - x) * (y2 - y)
+            + f[j1, i2] * (x - x1) * (y2 - y)
+            + f[j2, i1] * (x2 - x) * (y - y1)
+            + f[j2, i2] * (x - x1) * (y - y1)
+        )
+    )
+
+
+@numba.njit(float64(_axis, _axis, _grid, float64, float64), cache=True)
+def interpolate(xs, ys, f, x, y):
+    """Returns the bilinear interpolation of the grid values f at (x, y).
+
+    Arguments
+    ---------
+    xs, ys -- regularly spaced x and y coordinates of the grid.
+    f -- (len(ys), len(xs)) values on the grid.
+    x, y -- coordinates where to compute f(x,y)
+
+    """
+    i1, j1 = _locate(xs, ys, x, y)
+    return _interpolate_cell(xs, ys, f, i1, j1, x, y)
+
+
+@numba.njit(
+    float64[:, ::1](_axis, _axis, _grid, _grid, _grid), parallel=True, cache=True
+)
+def velocity_at(xs, ys, u, v, points):
+    """Returns the (n, 2) vectors (u, v) interpolated at (n, 2) points.
+
+    Arguments
+    ---------
+    xs, ys -- regularly spaced x and y coordinates of the grid.
+    u, v -- (len(ys), len(xs)) components of the vector field.
+    points -- (n, 2) x and y coordinates.
+
+    """
+    res = np.empty((points.shape[0], 2))
+    for n in numba.prange(points.shape[0]):
+        x, y = points[n, 0], points[n, 1]
+        i1, j1 = _locate(xs, ys, x, y)
+        res[n, 0] = _interpolate_cell(xs, ys, u, i1, j1, x, y)
+        res[n, 1] = _interpolate_cell(xs, ys, v, i1, j1, x, y)
+    return res
+
+
+def as_float64(*arrays):
+    """Returns the arrays as contiguous float64 arrays, the type of the kernels."""
+    return [np.ascontiguousarray(a, dtype=np.float64) for a in arrays]
+
+
+class VelocityInterpolator:
+    """Bilinear interpolator of a grid vector field.
+
+    The grid axes are extracted once, so that evaluating the field only
+    locates the points and interpolates both components together.
+
+    Arguments
+    ---------
+    X, Y -- mesh grid.
+    u, v -- x and y components of the vector field.
+
+    """
+
+    def __init__(self, X, Y, u, v):
+        self.X, self.Y, self.u, self.v = X, Y, u, v
+        self.xs = np.ascontiguousarray(X[0, :], dtype=np.float64)
+        self.ys = np.ascontiguousarray(Y[:, 0], dtype=np.float64)
+        self._u = np.asarray(u, dtype=np.float64)
+        self._v = np.asarray(v, dtype=np.float64)
+
+    def __call__(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        single = points.ndim == 1
+        res = velocity_at(self.xs, self.ys, self._u, self._v, np.atleast_2d(points))
+        return res[0] if single else res
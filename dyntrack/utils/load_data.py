@@ -1,5 +1,4 @@
 from typing import Union, Optional
-import matplotlib.image as mpimg
 import pandas as pd
 import numpy as np
 from ..DynTrack import DynTrack
@@ -7,6 +6,36 @@ from .. import __path__
 import os
 
 
+def _read_columns(path, columns, dtype, chunksize):
+    """Yields chunks of the given columns of a csv, parquet or feather file."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in [".parquet", ".pq"] and chunksize is not None:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif ext in [".parquet", ".pq"]:
+        yield pd.read_parquet(path, columns=columns)
+    elif ext == ".feather":
+        yield pd.read_feather(path, columns=columns)
+    elif chunksize is None:
+        yield pd.read_csv(path, usecols=columns, dtype=dtype)
+    else:
+        yield from pd.read_csv(path, usecols=columns, dtype=dtype, chunksize=chunksize)
+
+
+def _compact_ids(values):
+    """Casts integral IDs to int32, or int64 when out of the int32 range."""
+    if values.dtype.kind == "f":
+        if len(values) == 0 or np.isnan(values).any() or (values % 1 != 0).any():
+            return values
+    elif values.dtype.kind not in "iu" or len(values) == 0:
+        return values
+    info = np.iinfo(np.int32)
+    fits = info.min <= values.min() and values.max() <= info.max
+    return values.astype(np.int32 if fits else np.int64)
+
+
 def load_data(
     df: Union[pd.DataFrame, str],
     x_col: str,
@@ -14,14 +43,19 @@ def load_data(
     parent_col: str,
     time_col: str,
     img: Optional[Union[np.ndarray, str]] = None,
+    chunksize: Optional[int] = None,
+    float_dtype: str = "float32",
 ):
     """\
     Load data required for dynamical tracks analysis.
 
+    Only the four needed columns are read, coordinates are stored as
+    `float_dtype` and integral track and time IDs as 32 bits integers.
+
     Parameters
     ----------
     df
-        Path of a csv file, or a :class:`pandas.DataFrame` object.
+        Path of a csv, parquet or feather file, or a :class:`pandas.DataFrame` object.
     x_col
         Name of the x coordinate column.
     x_col
@@ -32,6 +66,11 @@ def load_data(
         Name of the time/frame ID column.
     img
         Path of an img file, or a :class:`numpy.ndarray`.
+    chunksize
+        Number of rows read at once from csv or parquet files, by default reads
+        the whole file at once.
+    float_dtype
+        dtype of the coordinates.
 
     Returns
     -------
@@ -39,10 +78,31 @@ def load_data(
         A DynTrack object
     """
 
-    tdata = pd.read_csv(df) if type(df) is str else df
-    tdata = tdata[[x_col, y_col, parent_col, time_col]]
-    tdata.columns = ["Position X", "Position Y", "Parent", "Time"]
-    img = mpimg.imread(img) if type(img) is str else img
+    columns = [x_col, y_col, parent_col, time_col]
+    if isinstance(df, pd.DataFrame):
+        chunks = [df[columns]]
+    else:
+        dtype = {x_col: float_dtype, y_col: float_dtype}
+        chunks = _read_columns(df, columns, dtype, chunksize)
+
+    parts = [[], [], [], []]
+    for chunk in chunks:
+        parts[0].append(chunk[x_col].values.astype(float_dtype, copy=False))
+        parts[1].append(chunk[y_col].values.astype(float_dtype, copy=False))
+        parts[2].append(_compact_ids(chunk[parent_col].values))
+        parts[3].append(_compact_ids(chunk[time_col].values))
+
+    tdata = pd.DataFrame(
+        {
+            name: part[0] if len(part) == 1 else np.concatenate(part)
+            for name, part in zip(["Position X", "Position Y", "Parent", "Time"], parts)
+        },
+        copy=False,
+    )
+    if type(img) is str:
+        import matplotlib.image as mpimg
+
+        img = mpimg.imread(img)
 
     return DynTrack(tdata, img)
 
@@ -0,0 +1,14 @@
+import numpy as np
+from ..DynTrack import DynTrack
+
+
+def track_segments(DT: DynTrack):
+    """Returns the (n, 2, 2) segments joining consecutive points of each track,
+    with the time of their first point and their duration."""
+    order, _, offsets = DT.group_index("Parent")
+    xy = DT.track_data[["Position X", "Position Y"]].values[order].astype(float)
+    time = DT.track_data["Time"].values[order].astype(float)
+    keep = np.ones(max(len(xy) - 1, 0), dtype=bool)
+    keep[offsets[1:-1] - 1] = False
+    segments = np.stack([xy[:-1], xy[1:]], axis=1)[keep]
+    return segments, time[:-1][keep], np.diff(time)[keep]
@@ -0,0 +1,201 @@
+import importlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from ..DynTrack import DynTrack
+
+# classes stored through their attributes rather than pickled
+_ATTRIBUTE_CLASSES = {"simpleppt.SimplePPT:SimplePPT"}
+
+
+def _write(obj, path):
+    """Writes obj under path, returns the description needed to read it back."""
+    if isinstance(obj, np.ndarray) and obj.dtype != object:
+        np.save(path + ".npy", obj)
+        return {"type": "array"}
+    if isinstance(obj, pd.RangeIndex):
+        return {
+            "type": "RangeIndex",
+            "start": obj.start,
+            "stop": obj.stop,
+            "step": obj.step,
+            "name": obj.name,
+        }
+    if isinstance(obj, pd.Index):
+        return {
+            "type": "Index",
+            "values": _write(obj.values, path),
+            "name": obj.name,
+        }
+    if isinstance(obj, pd.DataFrame):
+        os.mkdir(path)
+        return {
+            "type": "DataFrame",
+            "columns": [
+                [name, _write(obj[name].values, os.path.join(path, str(i)))]
+                for i, name in enumerate(obj.columns)
+            ],
+            "index": _write(obj.index, os.path.join(path, "index")),
+        }
+    if isinstance(obj, dict):
+        os.mkdir(path)
+        return {
+            "type": "dict",
+            "items": [
+                [
+                    _write(k, os.path.join(path, f"{i}_key")),
+                    _write(v, os.path.join(path, str(i))),
+                ]
+                for i, (k, v) in enumerate(obj.items())
+            ],
+        }
+    if isinstance(obj, (list, tuple)):
+        os.mkdir(path)
+        return {
+            "type": type(obj).__name__,
+            "items": [_write(v, os.path.join(path, str(i))) for i, v in enumerate(obj)],
+        }
+    if isinstance(obj, np.generic):
+        return {"type": "value", "value": obj.item()}
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return {"type": "value", "value": obj}
+    cls = f"{type(obj).__module__}:{type(obj).__qualname__}"
+    if cls in _ATTRIBUTE_CLASSES:
+        return {"type": "object", "class": cls, "attrs": _write(vars(obj), path)}
+    # anything else, including pandas extension arrays such as string
+    # columns, is pickled to keep its dtype
+    with open(path + ".pkl", "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return {"type": "pickle"}
+
+
+def _read(desc, path):
+    """Reads back an object written by _write, arrays being memory-mapped."""
+    kind = desc["type"]
+    if kind == "array":
+        return np.load(path + ".npy", mmap_mode="r")
+    if kind == "RangeIndex":
+        return pd.RangeIndex(
+            desc["start"], desc["stop"], desc["step"], name=desc["name"]
+        )
+    if kind == "Index":
+        return pd.Index(_read(desc["values"], path), name=desc["name"], copy=False)
+    if kind == "DataFrame":
+        return pd.DataFrame(
+            {
+                name: _read(d, os.path.join(path, str(i)))
+                for i, (name, d) in enumerate(desc["columns"])
+            },
+            index=_read(desc["index"], os.path.join(path, "index")),
+            copy=False,
+        )
+    if kind == "dict":
+        return {
+            _read(k, os.path.join(path, f"{i}_key")): _read(
+                d, os.path.join(path, str(i))
+            )
+            for i, (k, d) in enumerate(desc["items"])
+        }
+    if kind in ["list", "tuple"]:
+        items = [
+            _read(d, os.path.join(path, str(i))) for i, d in enumerate(desc["items"])
+        ]
+        return items if kind == "list" else tuple(items)
+    if kind == "value":
+        return desc["value"]
+    if kind == "object":
+        if desc["class"] not in _ATTRIBUTE_CLASSES:
+            raise ValueError(f"cannot read objects of class {desc['class']}")
+        module, name = desc["class"].split(":")
+        obj = object.__new__(getattr(importlib.import_module(module), name))
+        obj.__dict__.update(_read(desc["attrs"], path))
+        return obj
+    with open(path + ".pkl", "rb") as f:
+        return pickle.load(f)
+
+
+def write(DT: DynTrack, path: str):
+    """\
+    Save a DynTrack object to a directory.
+
+    Arrays are stored as `.npy` files, read back memory-mapped by
+    :func:`dyntrack.ut.read`. An existing directory at `path` is replaced.
+
+    Parameters
+    ----------
+    DT
+        A :class:`dyntrack.DynTrack` object.
+    path
+        Directory to write to.
+
+    """
+    path = os.path.abspath(path)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(path), prefix=".dyntrack_")
+    try:
+        # private attributes are either stored separately or caches
+        attrs = {k: v for k, v in vars(DT).items() if not k.startswith("_")}
+        meta = {
+            "track_data": _write(DT.track_data, os.path.join(tmp, "track_data")),
+            "index": _write(
+                {by: DT.group_index(by) for by in DT._index},
+                os.path.join(tmp, "index"),
+            ),
+            "attrs": _write(attrs, os.path.join(tmp, "attrs")),
+        }
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+    except BaseException:
+        shutil.rmtree(tmp)
+        raise
+
+    # files of a previous save may still be memory-mapped, they are moved
+    # away rather than overwritten
+    if os.path.exists(path):
+        old = tempfile.mkdtemp(dir=os.path.dirname(path), prefix=".dyntrack_")
+        os.rename(path, os.path.join(old, "old"))
+        os.rename(tmp, path)
+        shutil.rmtree(old)
+    else:
+        os.rename(tmp, path)
+
+
+def read(path: str):
+    """\
+    Read a DynTrack object saved with :meth:`dyntrack.DynTrack.save`.
+
+    Arrays are memory-mapped read-only, so that only the data actually used
+    is read from disk.
+
+    Parameters
+    ----------
+    path
+        Directory written by :meth:`dyntrack.DynTrack.save`.
+
+    Returns
+    -------
+    :class:`dyntrack.DynTrack`
+        A DynTrack object
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    DT = DynTrack.__new__(DynTrack)
+    # attributes missing from older saves keep their default value
+    for name, param in inspect.signature(DynTrack.__init__).parameters.items():
+        if param.default is not inspect.Parameter.empty:
+            setattr(DT, name, param.default)
+    DT._track_data = _read(meta["track_data"], os.path.join(path, "track_data"))
+    DT._index = {
+        by: tuple(index)
+        for by, index in _read(meta["index"], os.path.join(path, "index")).items()
+    }
+    DT._indexed = {by: DT._track_data[by] for by in DT._index}
+    vars(DT).update(_read(meta["attrs"], os.path.join(path, "attrs")))
+    return DT
@@ -0,0 +1,755 @@
+"""In-process port of the vfkm vector field solver.
+
+The original C++ implementation (see ``vfkm/``) clips every track against the
+triangulated grid, builds one constraint per clipped segment and fits the grid
+vector field with a conjugate gradient solve of
+
+    (C^T W C + smooth / n * L^T L) x = C^T W r
+
+where ``C`` interpolates the field at segment endpoints, ``W`` weights each
+segment by its duration and ``L`` is the cotangent Laplacian of the grid. This
+module assembles the same system with sparse matrices, directly from the track
+arrays.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import numba
+from numba import boolean, float64, int64, types
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+# kernels are compiled for read-only arrays, which writeable ones convert to
+_vector = types.Array(float64, 1, "A", readonly=True)
+
+# LT . L = [[1/3 1/6] [1/6 1/3]], the segment mass matrix
+_M = np.array([[1 / 3, 1 / 6], [1 / 6, 1 / 3]])
+
+
+class Grid:
+    """Regular grid triangulated along the x - y = k diagonals.
+
+    Arguments
+    ---------
+    x, y -- lower left corner of the domain.
+    w, h -- width and height of the domain.
+    res -- number of vertices on each side of the grid.
+
+    """
+
+    def __init__(self, x, y, w, h, res):
+        self.x, self.y, self.w, self.h = x, y, w, h
+        self.res = res
+        self.dx = w / (res - 1)
+        self.dy = h / (res - 1)
+
+    @property
+    def n(self):
+        return self.res * self.res
+
+    def to_grid(self, x, y):
+        return (x - self.x) / self.dx, (y - self.y) / self.dy
+
+    def meshgrid(self):
+        return np.meshgrid(
+            np.linspace(self.x, self.x + self.w, self.res),
+            np.linspace(self.y, self.y + self.h, self.res),
+        )
+
+    def laplacian(self):
+        """Returns the cotangent Laplacian of the grid as a csr matrix."""
+        res = self.res
+        row, col = np.divmod(np.arange(self.n), res)
+        # horizontal edges are weighted by the number of adjacent rows, and
+        # vertical edges by the number of adjacent columns
+        h_coef = (self.dy / self.dx) * ((row > 0) * 1.0 + (row < res - 1)) / 2
+        v_coef = (self.dx / self.dy) * ((col > 0) * 1.0 + (col < res - 1)) / 2
+
+        idx = np.arange(self.n)
+        right = col < res - 1
+        up = row < res - 1
+        i = np.concatenate([idx[right], idx[up]])
+        j = np.concatenate([idx[right] + 1, idx[up] + res])
+        w = np.concatenate([h_coef[right], v_coef[up]])
+
+        L = sparse.coo_matrix(
+            (np.concatenate([w, w]), (np.concatenate([i, j]), np.concatenate([j, i]))),
+            shape=(self.n, self.n),
+        ).tocsr()
+        L = L - sparse.diags(np.asarray(L.sum(axis=1)).ravel())
+        return L.tocsr()
+
+
+class CurveDescription:
+    """Clipped segments of all curves, each lying within one grid triangle.
+
+    Attributes
+    ----------
+    index -- (S, 2, 3) vertex indices of the triangle of each segment endpoint.
+    bary -- (S, 2, 3) barycentric coordinates of each segment endpoint.
+    dt -- (S,) duration of each segment.
+    rhs -- (S, 2) desired tangent (velocity) along each segment.
+    curve -- (S,) curve index of each segment.
+    length -- (m,) duration of each curve.
+    parent -- (m,) track ID of each curve.
+    time -- (S, 2) start and end time of the track segment of each segment.
+
+    """
+
+    def __init__(self, index, bary, dt, rhs, curve, length, parent, time=None):
+        self.index = index
+        self.bary = bary
+        self.dt = dt
+        self.rhs = rhs
+        self.curve = curve
+        self.length = length
+        self.parent = parent
+        self.time = time
+
+    @property
+    def n_curves(self):
+        return len(self.length)
+
+    def window(self, tmin, tmax):
+        """Returns the description of the track segments within [tmin, tmax].
+
+        Segments are kept whole, the part of each curve within the window
+        being a curve of its own, so that the tracks need not be clipped again.
+        """
+        kept = (self.time[:, 0] >= tmin) & (self.time[:, 1] <= tmax)
+        cids, curve = np.unique(self.curve[kept], return_inverse=True)
+        time = self.time[kept]
+        start = np.full(len(cids), np.inf)
+        end = np.full(len(cids), -np.inf)
+        np.minimum.at(start, curve, time[:, 0])
+        np.maximum.at(end, curve, time[:, 1])
+        return CurveDescription(
+            index=self.index[kept],
+            bary=self.bary[kept],
+            dt=self.dt[kept],
+            rhs=self.rhs[kept],
+            curve=curve,
+            length=end - start,
+            parent=self.parent[cids],
+            time=time,
+        )
+
+
+@numba.njit(
+    int64[:](
+        _vector,
+        _vector,
+        _vector,
+        types.Array(boolean, 1, "A", readonly=True),
+        float64,
+        float64,
+    ),
+    cache=True,
+)
+def _split_curves(x, y, t, new_track, tmin, tmax):
+    """Assign a curve index to each point, -1 for discarded points.
+
+    Mirrors ``Util::loadCurves``: points outside of [tmin, tmax] end a curve,
+    and points repeating the time or the position of the previous point are
+    skipped. new_track flags the first point of each track.
+    """
+    curve = np.full(len(x), -1)
+    cid = -1
+    last = -1
+    for i in range(len(x)):
+        if new_track[i]:
+            last = -1
+        if t[i] < tmin or t[i] > tmax:
+            last = -1
+            continue
+        if last == -1:
+            cid += 1
+        elif t[i] == t[last] or (x[i] == x[last] and y[i] == y[last]):
+            continue
+        curve[i] = cid
+        last = i
+    return curve
+
+
+def _crossings(a0, a1):
+    """Returns segment indices and parameters where a0->a1 crosses integers."""
+    lo, hi = np.minimum(a0, a1), np.maximum(a0, a1)
+    first = np.floor(lo) + 1
+    count = np.maximum(np.ceil(hi) - first, 0).astype(np.int64)
+    seg = np.repeat(np.arange(len(a0)), count)
+    offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    k = first[seg] + offset
+    return seg, (k - a0[seg]) / (a1[seg] - a0[seg])
+
+
+def _chunks(n, n_jobs):
+    bounds = np.linspace(0, n, n_jobs + 1).astype(np.int64)
+    return [slice(a, b) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def _map_chunks(func, n, n_jobs):
+    """Applies func to n_jobs contiguous slices of range(n), in threads."""
+    if n_jobs == 1:
+        return [func(slice(0, n))]
+    with ThreadPoolExecutor(n_jobs) as pool:
+        return list(pool.map(func, _chunks(n, n_jobs)))
+
+
+def _clip(grid, gx0, gy0, gx1, gy1):
+    """Clips segments, in grid coordinates, against the grid triangles.
+
+    Returns, for each clipped piece, the index of its segment, its start and
+    end parameters along the segment, and the (2, 3) vertices and barycentric
+    coordinates of its endpoints, both lying in the same triangle.
+    """
+    # clip against vertical, horizontal and diagonal lines
+    nseg = len(gx0)
+    cuts = [
+        (np.arange(nseg), np.zeros(nseg)),
+        (np.arange(nseg), np.ones(nseg)),
+        _crossings(gx0, gx1),
+        _crossings(gy0, gy1),
+        _crossings(gx0 - gy0, gx1 - gy1),
+    ]
+    cseg = np.concatenate([c[0] for c in cuts])
+    cu = np.concatenate([c[1] for c in cuts])
+    order = np.lexsort((cu, cseg))
+    cseg, cu = cseg[order], cu[order]
+    p = np.flatnonzero((cseg[:-1] == cseg[1:]) & (cu[1:] - cu[:-1] > 1e-9))
+    sub, u0, u1 = cseg[p], cu[p], cu[p + 1]
+
+    qx = np.stack([gx0[sub] + u0 * (gx1 - gx0)[sub], gx0[sub] + u1 * (gx1 - gx0)[sub]])
+    qy = np.stack([gy0[sub] + u0 * (gy1 - gy0)[sub], gy0[sub] + u1 * (gy1 - gy0)[sub]])
+
+    # locate the triangle from the segment midpoint
+    mx, my = qx.mean(axis=0), qy.mean(axis=0)
+    sx = np.clip(np.floor(mx), 0, grid.res - 2)
+    sy = np.clip(np.floor(my), 0, grid.res - 2)
+    bottom = (mx - sx) > (my - sy)
+    lx, ly = qx - sx, qy - sy
+
+    v1 = sy * grid.res + sx
+    v2 = np.where(bottom, v1 + 1, v1 + grid.res + 1)
+    v3 = np.where(bottom, v1 + grid.res + 1, v1 + grid.res)
+    index = np.broadcast_to(np.stack([v1, v2, v3], axis=-1), (2, len(sub), 3))
+    bary = np.where(
+        bottom[:, None],
+        np.stack([1 - lx, lx - ly, ly], axis=-1),
+        np.stack([1 - ly, lx, ly - lx], axis=-1),
+    )
+
+    return (
+        sub,
+        u0,
+        u1,
+        np.ascontiguousarray(index.transpose(1, 0, 2)).astype(np.int64),
+        np.ascontiguousarray(bary.transpose(1, 0, 2)),
+    )
+
+
+def curve_description(grid, x, y, t, parent, tmin=None, tmax=None, n_jobs=1):
+    """Returns the :class:`CurveDescription` of a set of tracks.
+
+    Arguments
+    ---------
+    grid -- the :class:`Grid` to clip the tracks against.
+    x, y, t, parent -- track coordinates, time and track ID, grouped by track.
+    tmin, tmax -- time window to consider, by default uses the whole range.
+    n_jobs -- number of threads used to clip the tracks.
+
+    """
+    tmin = t.min() if tmin is None else tmin
+    tmax = t.max() if tmax is None else tmax
+    new_track = np.append(True, parent[1:] != parent[:-1])
+    curve = _split_curves(x, y, t, new_track, tmin, tmax)
+
+    kept = curve >= 0
+    x, y, t, parent, curve = x[kept], y[kept], t[kept], parent[kept], curve[kept]
+    s = np.flatnonzero(curve[:-1] == curve[1:])
+
+    # curves going back in time are discarded, as in set_constraints
+    backward = np.unique(curve[s[t[s + 1] < t[s]]])
+    s = s[~np.isin(curve[s], backward)]
+
+    seg_curve = curve[s]
+    cids, seg_curve = np.unique(seg_curve, return_inverse=True)
+    first = np.searchsorted(curve, cids)
+    last = np.searchsorted(curve, cids, side="right") - 1
+
+    t0, t1 = t[s], t[s + 1]
+    rhs = np.column_stack([x[s + 1] - x[s], y[s + 1] - y[s]]) / (t1 - t0)[:, None]
+
+    # clip against the grid lines, by chunks of segments in n_jobs threads
+    gx0, gy0 = grid.to_grid(x[s], y[s])
+    gx1, gy1 = grid.to_grid(x[s + 1], y[s + 1])
+
+    def clip(chunk):
+        sub, u0, u1, index, bary = _clip(
+            grid, gx0[chunk], gy0[chunk], gx1[chunk], gy1[chunk]
+        )
+        return sub + chunk.start, u0, u1, index, bary
+
+    sub, u0, u1, index, bary = map(
+        np.concatenate, zip(*_map_chunks(clip, len(s), n_jobs))
+    )
+
+    dt = (t1 - t0)[sub] * (u1 - u0)
+    length = t[last] - t[first]
+
+    return CurveDescription(
+        index=index,
+        bary=bary,
+        dt=dt,
+        rhs=rhs[sub],
+        curve=seg_curve[sub],
+        length=length,
+        parent=parent[first],
+        time=np.column_stack([t0, t1])[sub],
+    )
+
+
+@numba.njit(
+    (
+        types.Array(int64, 3, "A", readonly=True),
+        types.Array(float64, 3, "A", readonly=True),
+        _vector,
+        types.Array(float64, 2, "A", readonly=True),
+        int64,
+        float64[:, :],
+        float64[:],
+        float64[:],
+    ),
+    nogil=True,
+    cache=True,
+)
+def _accumulate_data(index, bary, w, rhs, res, band, bx, by):
+    """Adds the data term of the segments to band, bx and by.
+
+    The three vertices of a segment triangle are neighbours on the grid, so
+    that row i of C^T W C is stored as the 3x3 block of vertices around i.
+    """
+    for s in range(index.shape[0]):
+        for k in range(3):
+            i = index[s, 0, k]
+            wb = 0.5 * w[s] * (bary[s, 0, k] + bary[s, 1, k])
+            bx[i] += wb * rhs[s, 0]
+            by[i] += wb * rhs[s, 1]
+            for l in range(3):
+                j = index[s, 0, l]
+                c = 0.0
+                for a in range(2):
+                    for b in range(2):
+                        c += _M[a, b] * bary[s, a, k] * bary[s, b, l]
+                slot = (j // res - i // res + 1) * 3 + (j % res - i % res + 1)
+                band[i, slot] += w[s] * c
+
+
+def data_term(grid, cd, curves=None, n_jobs=1):
+    """Returns C^T W C and C^T W r, the data term of the fit.
+
+    The weights are not scaled by the smoothness, so that the data term can
+    be reused for several smoothness values.
+
+    Arguments
+    ---------
+    grid -- the :class:`Grid` of the vector field.
+    cd -- the :class:`CurveDescription` of the tracks.
+    curves -- indices of the curves to fit, by default uses all.
+    n_jobs -- number of threads accumulating the segments, each in its own
+    buffers.
+
+    """
+    sel = slice(None) if curves is None else np.isin(cd.curve, curves)
+    index, bary, rhs = cd.index[sel], cd.bary[sel], cd.rhs[sel]
+    w = cd.dt[sel] / cd.length.sum()
+
+    def accumulate(chunk):
+        band = np.zeros((grid.n, 9))
+        bx, by = np.zeros(grid.n), np.zeros(grid.n)
+        _accumulate_data(
+            index[chunk], bary[chunk], w[chunk], rhs[chunk], grid.res, band, bx, by
+        )
+        return band, bx, by
+
+    band, bx, by = map(sum, zip(*_map_chunks(accumulate, len(w), n_jobs)))
+
+    # slot (di + 1) * 3 + (dj + 1) of row i holds column i + di * res + dj
+    di, dj = np.divmod(np.arange(9), 3)
+    rows = np.repeat(np.arange(grid.n), 9)
+    cols = rows + np.tile((di - 1) * grid.res + (dj - 1), grid.n)
+    vals = band.ravel()
+    nz = vals != 0
+    D = sparse.csr_matrix((vals[nz], (rows[nz], cols[nz])), shape=(grid.n, grid.n))
+
+    return D, bx, by
+
+
+def assemble(grid, cd, smooth, curves=None, L2=None, data=None, n_jobs=1):
+    """Returns the system matrix and the right hand sides of the fit.
+
+    Arguments
+    ---------
+    grid -- the :class:`Grid` of the vector field.
+    cd -- the :class:`CurveDescription` of the tracks.
+    smooth -- smoothness weight, between 0 and 1.
+    curves -- indices of the curves to fit, by default uses all.
+    L2 -- precomputed L^T L, computed from grid if not provided.
+    data -- precomputed :func:`data_term` of the curves.
+    n_jobs -- number of threads used to assemble the data term.
+
+    """
+    L2 = grid.laplacian() @ grid.laplacian() if L2 is None else L2
+    D, bx, by = data_term(grid, cd, curves, n_jobs) if data is None else data
+    A = D * (1.0 - smooth) + L2 * (smooth / grid.n)
+    return A, bx * (1.0 - smooth), by * (1.0 - smooth)
+
+
+def cg_solve(A, b, x, tol=1e-8, max_iter=10000, precond=None):
+    """Solves A x = b with preconditioned conjugate gradients, starting from x.
+
+    Arguments
+    ---------
+    A -- symmetric positive definite matrix.
+    b -- right hand side.
+    x -- initial guess.
+    tol -- tolerance on the residual norm, relative to the norm of b.
+    max_iter -- maximum number of iterations.
+    precond -- callable applying the inverse of the preconditioner.
+
+    Returns the solution and the number of iterations performed.
+    """
+    x = x.copy()
+    normb = np.linalg.norm(b)
+    normb = 1.0 if normb == 0 else normb
+    r = b - A @ x
+    if np.linalg.norm(r) / normb <= tol:
+        return x, 0
+
+    rho_1 = 1.0
+    p = np.zeros_like(x)
+    i = 0
+    for i in range(1, max_iter + 1):
+        z = r if precond is None else precond(r)
+        rho = r @ z
+        p = z + (rho / rho_1) * p if i > 1 else z.copy()
+        q = A @ p
+        alpha = rho / (p @ q)
+        x += alpha * p
+        r -= alpha * q
+        if np.linalg.norm(r) / normb <= tol:
+            break
+        rho_1 = rho
+    return x, i
+
+
+def _inverse_diagonal(A):
+    d = A.diagonal()
+    return 1.0 / np.where(d == 0, 1.0, d)
+
+
+def jacobi(A):
+    """Returns the Jacobi preconditioner of A."""
+    dinv = _inverse_diagonal(A)
+    return lambda r: dinv * r
+
+
+def _interpolation(res_c, res_f):
+    """Linear interpolation from res_c to res_f regularly spaced points."""
+    x = np.linspace(0, res_c - 1, res_f)
+    i = np.minimum(np.floor(x).astype(np.int64), res_c - 2)
+    w = x - i
+    return sparse.csr_matrix(
+        (
+            np.column_stack([1 - w, w]).ravel(),
+            (np.repeat(np.arange(res_f), 2), np.column_stack([i, i + 1]).ravel()),
+        ),
+        shape=(res_f, res_c),
+    )
+
+
+def upsample(values, res_c, res_f):
+    """Bilinearly interpolates values from a res_c to a res_f grid.
+
+    Both grids cover the same domain, values is a (..., res_c * res_c) array.
+    """
+    P = _interpolation(res_c, res_f)
+    return (sparse.kron(P, P, format="csr") @ values.T).T
+
+
+class Multigrid:
+    """Geometric multigrid V-cycle on the regular grid, used as preconditioner.
+
+    Coarse levels halve the grid resolution, with bilinear prolongation and
+    Galerkin coarse operators, damped Jacobi smoothing and a direct solve on
+    the coarsest level.
+
+    Arguments
+    ---------
+    A -- system matrix on a res x res grid.
+    res -- resolution of the grid.
+    min_res -- resolution below which the system is solved directly.
+    n_smooth -- number of pre- and post-smoothing sweeps.
+
+    """
+
+    def __init__(self, A, res, min_res=8, n_smooth=2):
+        self.n_smooth = n_smooth
+        self.levels = []
+        while res > min_res:
+            res_c = (res + 1) // 2
+            P = _interpolation(res_c, res)
+            P = sparse.kron(P, P, format="csr")
+            self.levels.append((A, P, self._smoother_weights(A)))
+            A = (P.T @ A @ P).tocsr()
+            res = res_c
+        self.coarse = splu(A.tocsc())
+
+    @staticmethod
+    def _smoother_weights(A, n_power=10):
+        # damping of 4 / (3 rho), rho being the spectral radius of D^-1 A
+        dinv = _inverse_diagonal(A)
+        x = np.random.default_rng(0).random(A.shape[0])
+        for _ in range(n_power):
+            x = dinv * (A @ x)
+            rho = np.linalg.norm(x)
+            x /= rho
+        return 4.0 / (3.0 * rho) * dinv
+
+    def __call__(self, r):
+        return self._vcycle(0, r)
+
+    def _vcycle(self, level, b):
+        if level == len(self.levels):
+            return self.coarse.solve(b)
+        A, P, w = self.levels[level]
+        x = w * b
+        for _ in range(self.n_smooth - 1):
+            x += w * (b - A @ x)
+        x += P @ self._vcycle(level + 1, P.T @ (b - A @ x))
+        for _ in range(self.n_smooth):
+            x += w * (b - A @ x)
+        return x
+
+
+_PRECONDITIONERS = {
+    "none": lambda A, grid: None,
+    "jacobi": lambda A, grid: jacobi(A),
+    "multigrid": lambda A, grid: Multigrid(A, grid.res),
+}
+
+
+def curve_errors(cd, u, v, smooth):
+    """Returns the fitting error of each curve against the field (u, v)."""
+    e = 0.0
+    for f, r in ((u, cd.rhs[:, 0]), (v, cd.rhs[:, 1])):
+        c = (f[cd.index] * cd.bary).sum(axis=-1) - r[:, None]
+        e = e + (c[:, 0] ** 2 + c[:, 0] * c[:, 1] + c[:, 1] ** 2) / 3.0
+    e = np.bincount(cd.curve, e, cd.n_curves) * cd.length
+    return e * (1.0 - smooth) / cd.length.sum()
+
+
+def _repopulate_empty_fields(assignment, us, vs):
+    """Gives half of the curves of the largest field to each empty field."""
+    for i in range(len(us)):
+        if not (assignment == i).any():
+            us[i], vs[i] = 0.0, 0.0
+            largest = np.bincount(assignment, minlength=len(us)).argmax()
+            members = np.flatnonzero(assignment == largest)
+            assignment[members[1::2]] = i
+
+
+def optimize(
+    grid,
+    cd,
+    n_fields,
+    smooth,
+    n_jobs=1,
+    max_iter=100,
+    tol=1e-8,
+    cg_max_iter=10000,
+    preconditioner="multigrid",
+    u0=None,
+    v0=None,
+    L2=None,
+    data=None,
+):
+    """Fits n_fields vector fields while clustering the curves between them.
+
+    Mirrors ``Optimizer::optimizeImplicitFastWithWeights``: fields are seeded
+    with the worst fitted curve, then fitting and reassignment of curves to
+    their best field alternate until no curve changes field. Per-field solves
+    and error evaluations run in a pool of n_jobs threads, which are shared
+    between the fields for assembling the systems. Each linear system
+    is solved by conjugate gradients up to the relative tolerance tol, with
+    the preconditioner being one of "none", "jacobi" or "multigrid".
+
+    When the (n_fields, n) initial fields u0, v0 are given, they replace the
+    seeding and curves start assigned to their best initial field. L2 and
+    the data term of all the curves can be given when already computed.
+
+    Returns the (n_fields, n) components of the fields, the field index and
+    the error of each curve, and the total number of CG iterations.
+    """
+    L2 = grid.laplacian() @ grid.laplacian() if L2 is None else L2
+    zeros = np.zeros(grid.n)
+    make_precond = _PRECONDITIONERS[preconditioner]
+    iterations = []
+    assembly_jobs = max(1, n_jobs // n_fields)
+
+    def fit(curves, u0, v0):
+        A, bx, by = assemble(
+            grid,
+            cd,
+            smooth,
+            curves,
+            L2,
+            data if curves is None else None,
+            assembly_jobs,
+        )
+        M = make_precond(A, grid)
+        u, it_u = cg_solve(A, bx, u0, tol, cg_max_iter, M)
+        v, it_v = cg_solve(A, by, v0, tol, cg_max_iter, M)
+        iterations.extend((it_u, it_v))
+        return u, v
+
+    if n_fields == 1:
+        u, v = fit(None, *((zeros, zeros) if u0 is None else (u0[0], v0[0])))
+        assignment = np.zeros(cd.n_curves, dtype=np.int64)
+        errors = curve_errors(cd, u, v, smooth)
+        return u[None], v[None], assignment, errors, sum(iterations)
+
+    if u0 is None:
+        # first assignment, each field being fitted to the currently worst curve
+        errors = np.full((n_fields, cd.n_curves), 1e10)
+        for i in range(n_fields):
+            u, v = fit([np.argmax(errors.min(axis=0))], zeros, zeros)
+            errors[i] = curve_errors(cd, u, v, smooth)
+        us, vs = np.zeros((n_fields, grid.n)), np.zeros((n_fields, grid.n))
+    else:
+        errors = np.array(
+            [curve_errors(cd, u0[i], v0[i], smooth) for i in range(n_fields)]
+        )
+        us, vs = u0.copy(), v0.copy()
+    assignment = np.argmin(errors, axis=0)
+    _repopulate_empty_fields(assignment, us, vs)
+
+    curves = np.arange(cd.n_curves)
+    with ThreadPoolExecutor(n_jobs) as pool:
+        for _ in range(max_iter):
+            fields = pool.map(
+                lambda i: fit(np.flatnonzero(assignment == i), us[i], vs[i]),
+                range(n_fields),
+            )
+            us, vs = map(np.array, zip(*fields))
+
+            errors = np.array(
+                list(
+                    pool.map(
+                        lambda i: curve_errors(cd, us[i], vs[i], smooth),
+                        range(n_fields),
+                    )
+                )
+            )
+            best = errors.argmin(axis=0)
+            changed = errors[best, curves] < errors[assignment, curves]
+            assignment = np.where(changed, best, assignment)
+            _repopulate_empty_fields(assignment, us, vs)
+            if not changed.any():
+                break
+
+    return us, vs, assignment, errors[assignment, curves], sum(iterations)
+
+
+def optimize_windows(grid, cd, windows, smooth, u0, v0, n_jobs=1, L2=None, **kwargs):
+    """Fits one vector field to the curves of each time window.
+
+    Windows are split into n_jobs runs of consecutive windows solved in
+    parallel threads. The first window of each run starts from u0, v0, and
+    the following ones from the field of their previous window, which is
+    also kept for windows without any segment.
+
+    Arguments
+    ---------
+    grid -- the :class:`Grid` of the vector field.
+    cd -- the :class:`CurveDescription` of all the tracks.
+    windows -- (w, 2) start and end time of each window.
+    smooth -- smoothness weight, between 0 and 1.
+    u0, v0 -- (n,) initial field, usually fitted to all the tracks.
+    n_jobs -- number of threads.
+    L2 -- precomputed L^T L, computed from grid if not provided.
+    kwargs -- solver options passed to optimize.
+
+    Returns the (w, n) components of the fields, and the total number of CG
+    iterations.
+    """
+    L2 = grid.laplacian() @ grid.laplacian() if L2 is None else L2
+    us, vs = np.empty((len(windows), grid.n)), np.empty((len(windows), grid.n))
+
+    def run(chunk):
+        u, v, iterations = u0, v0, 0
+        for w in range(chunk.start, chunk.stop):
+            cd_w = cd.window(*windows[w])
+            if len(cd_w.dt) > 0:
+                u, v, _, _, it = optimize(
+                    grid, cd_w, 1, smooth, u0=u[None], v0=v[None], L2=L2, **kwargs
+                )
+                u, v, iterations = u[0], v[0], iterations + it
+            us[w], vs[w] = u, v
+        return iterations
+
+    n_jobs = min(n_jobs, len(windows))
+    return us, vs, sum(_map_chunks(run, len(windows), n_jobs))
+
+
+def vfkm(
+    x, y, t, parent, gridRes, smooth, n_fields=1, n_jobs=1, windows=None, **kwargs
+):
+    """Fits vector fields to a set of tracks, coarse to fine.
+
+    Arguments
+    ---------
+    x, y, t, parent -- track coordinates, time and track ID, grouped by track.
+    gridRes -- grid resolution in both horizontal and vertical axis, or a
+    sequence of resolutions, each level starting from the bilinearly
+    upsampled fields of the previous one.
+    smooth -- smoothness weight, between 0 and 1.
+    n_fields -- number of vector fields to cluster the tracks into.
+    n_jobs -- number of threads used to clip the tracks and fit the fields.
+    windows -- (w, 2) start and end time of windows to fit a field to at the
+    finest level, starting from the field of all the tracks, see
+    optimize_windows. Requires n_fields to be 1.
+    kwargs -- solver options passed to optimize.
+
+    Yields, for each level, the resolution, the grid coordinates X, Y, the
+    (n_fields, res, res) vector components u, v, the track ID, field index
+    and error of each curve, the total number of CG iterations, and the
+    (w, res, res) vector components of the windows at the finest level,
+    None otherwise.
+    """
+    if windows is not None and n_fields != 1:
+        raise ValueError("time windows require n_fields=1")
+    levels = list(map(int, np.atleast_1d(gridRes)))
+    us = vs = None
+    for level, res in enumerate(levels):
+        grid = Grid(x.min(), y.min(), x.max() - x.min(), y.max() - y.min(), res)
+        cd = curve_description(grid, x, y, t, parent, n_jobs=n_jobs)
+        if us is not None:
+            us, vs = upsample(us, res_c, res), upsample(vs, res_c, res)
+        L2 = grid.laplacian() @ grid.laplacian()
+        us, vs, assignment, errors, iterations = optimize(
+            grid, cd, n_fields, smooth, n_jobs, u0=us, v0=vs, L2=L2, **kwargs
+        )
+        res_c = res
+
+        X, Y = grid.meshgrid()
+        shape = (n_fields, res, res)
+        u, v = us.reshape(shape), vs.reshape(shape)
+        u_t = v_t = None
+        if windows is not None and level == len(levels) - 1:
+            u_t, v_t, it = optimize_windows(
+                grid, cd, windows, smooth, us[0], vs[0], n_jobs, L2, **kwargs
+            )
+            u_t, v_t = u_t.reshape(-1, res, res), v_t.reshape(-1, res, res)
+            iterations += it
+        yield res, X, Y, u, v, cd.parent, assignment, errors, iterations, u_t, v_t
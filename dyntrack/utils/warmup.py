@@ -0,0 +1,14 @@
+import importlib
+
+
+def warmup():
+    """\
+    Compile the numba kernels of dyntrack, or load them from the disk cache.
+
+    Kernels are compiled for explicit signatures and cached on disk the first
+    time their module is imported. Calling this once after installation, or
+    before starting a pool of workers, spares the compilation to the first
+    call of each tool in later processes.
+    """
+    for module in [".FTLE", ".vfkm", ".interpolate", ".density"]:
+        importlib.import_module(module, __package__)